@@ -1,75 +1,128 @@
+import time
 import asyncio
+import cProfile
 import logging
-from typing import Optional, List, Dict
+from itertools import groupby
+from collections import Counter
+from typing import Optional, List, Dict, Set, Any
 
 import aiogram
 
 from .config import BotConfig
-from .commands import BotCommands
+from .commands import BotCommands, CommandDispatcher
+from .digest import render_digest
 from .link import Link
 from .post import Post
 from .loader import Loader
+from .pool import BotPool
+from .render import render_post
+from .trace import Tracer
+from .util import JsonObject
 
 class Bot:
     LOG_FORMAT: str = '[%(asctime).19s] [%(name)s] [%(levelname)s] %(message)s'
+    UPDATE_LIMIT: int = 100
+    PREWARM_LEAD: int = 5
 
     def __init__(self,
                  config_path: str,
-                 loop: Optional[asyncio.AbstractEventLoop] = None):
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 profile_cycles: int = 0,
+                 profile_path: str = 'bot.prof'):
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
 
+        self.profile_cycles: int = profile_cycles
+        self.profile_path: str = profile_path
+        self.profiler: Optional[cProfile.Profile] = None
+        if profile_cycles > 0:
+            self.profiler = cProfile.Profile()
+
         self.started_polling: bool = False
         self.updating_links: bool = False
         self.started_updating_links: bool = False
         self.stopped_updating_links: Optional[asyncio.Future] = None
         self._update_task: Optional[asyncio.Task] = None
         self._poll_task: Optional[asyncio.Task] = None
+        self._prime_tasks: Set[asyncio.Task] = set()
+        self.stats: Counter = Counter()
+        self.overloaded: bool = False
+        self.delivering: bool = False
+        self.pending: Dict[int, List[Post]] = {}
+        self.carry_over: Set[Link] = set()
 
         self.config: BotConfig = BotConfig(config_path)
+        self.tracer: Tracer = Tracer(self.config['trace_path'])
         self.proxy = self.config['proxy'] or None
         self.loader: Loader = Loader(
             loop=self.loop,
             proxy=self.proxy,
+            validators=self.config.get_link_validators(),
+            tracer=self.tracer,
             **self.config['loader']
         )
 
-        self.bot: aiogram.Bot = aiogram.Bot(
-            token=self.config['token'],
+        self.bot: aiogram.Bot = self.create_bot(self.config['token'])
+        self.pool: BotPool = BotPool(
+            self.config, self.bot,
+            [self.create_bot(token) for token in self.config['send_tokens']]
+        )
+        self.dispatcher: aiogram.Dispatcher = CommandDispatcher(
+            self.bot, loop=self.loop
+        )
+        self.commands: BotCommands = BotCommands(
+            self.config, self.dispatcher,
+            on_link_added=self.prime_link
+        )
+
+    def create_bot(self, token: str) -> aiogram.Bot:
+        return aiogram.Bot(
+            token=token,
             proxy=self.proxy or None,
             loop=self.loop,
             connections_limit=self.config['connections_limit']
         )
-        self.dispatcher: aiogram.Dispatcher = aiogram.Dispatcher(
-            self.bot, loop=self.loop
-        )
-        self.commands: BotCommands = BotCommands(self.config, self.dispatcher)
 
     async def init(self) -> None:
         self.logger.info('initializing bot')
-        bot_user: aiogram.types.User = await self.bot.get_me()
-        username: str = bot_user.mention[1:]
+        bot_user: JsonObject = self.config['bot_user']
+        if bot_user.get('id') != self.bot.id or not bot_user.get('username'):
+            user: aiogram.types.User = await self.bot.get_me()
+            bot_user = {'id': user.id, 'username': user.username}
+            self.config['bot_user'] = bot_user
+        username: str = bot_user['username']
         self.logger.info('username = %r', username)
         self.commands.username = username
 
-    async def run(self) -> None:
+    async def run(self) -> Counter:
         try:
             await self.init()
             self.logger.info('running bot')
-            bot_user: aiogram.types.User = await self.bot.get_me()
-            self.commands.username = bot_user.mention[1:]
             await self.process_bot_updates()
             await self.process_link_updates()
+            if self._prime_tasks:
+                await asyncio.gather(*self._prime_tasks)
         finally:
             self.save()
+            self.logger.info(
+                'summary: %s',
+                ' '.join(f'{key}={value}' for key, value in sorted(
+                    (self.stats + self.loader.stats).items()
+                ))
+                or 'nothing to do'
+            )
+        return self.stats
 
     async def start(self) -> None:
         try:
             await self.init()
             self.logger.info('starting bot')
+            self.config.start_checkpoints(self.loop)
             self.started_polling = True
             self._poll_task = asyncio.create_task(
-                self.dispatcher.start_polling()
+                self.dispatcher.start_polling(
+                    allowed_updates=BotCommands.ALLOWED_UPDATES
+                )
             )
             self._update_task = asyncio.create_task(self.start_updating_links())
             await asyncio.gather(self._poll_task, self._update_task)
@@ -92,7 +145,8 @@ class Bot:
             while self.updating_links:
                 try:
                     await self.process_link_updates()
-                    await asyncio.sleep(self.config['link_update_interval'])
+                    if self.updating_links:
+                        await self.wait_next_cycle()
                 except (KeyboardInterrupt, asyncio.CancelledError):
                     self.logger.info('start_updating_links cancelled')
                     raise
@@ -107,6 +161,34 @@ class Bot:
             self.stopped_updating_links.set_result(None)
             self._update_task = None
 
+    async def wait_next_cycle(self) -> None:
+        interval: int = self.config['link_update_interval']
+        if (self.loader.prewarm_connections <= 0 or
+                interval <= self.PREWARM_LEAD):
+            await asyncio.sleep(interval)
+            return
+        await asyncio.sleep(interval - self.PREWARM_LEAD)
+        start: float = time.monotonic()
+        try:
+            await self.loader.prewarm(self.config.get_links(
+                current_time=int(time.time()) + self.PREWARM_LEAD
+            ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.logger.error('error opening connections: %r', ex, exc_info=ex)
+        await asyncio.sleep(
+            max(0, self.PREWARM_LEAD - (time.monotonic() - start))
+        )
+
+    async def drain(self) -> None:
+        self.updating_links = False
+        if self._update_task is None or not self.delivering:
+            return
+        timeout: float = self.config['drain_timeout']
+        self.logger.info('draining link updates (timeout=%r)', timeout)
+        await asyncio.wait([self.stopped_updating_links], timeout=timeout)
+
     def stop_updating_links(self):
         self.logger.info('stop updating links')
         self.updating_links = False
@@ -115,85 +197,326 @@ class Bot:
             self._update_task.cancel()
 
     async def process_bot_updates(self) -> None:
-        offset: Optional[int] = self.config['last_update_id']
-        if offset < 0:
-            offset = None
-        else:
-            offset += 1
         timeout: int = self.config['update_timeout']
-        self.logger.info(
-            'getting updates (offset=%r timeout=%r)',
-            offset, timeout
-        )
-        updates: List[aiogram.types.Update] = await self.bot.get_updates(
-            offset=offset, timeout=timeout
-        )
-        if updates:
+        while True:
+            offset: Optional[int] = self.config['last_update_id']
+            if offset < 0:
+                offset = None
+            else:
+                offset += 1
+            self.logger.info(
+                'getting updates (offset=%r timeout=%r)',
+                offset, timeout
+            )
+            updates: List[aiogram.types.Update] = await self.bot.get_updates(
+                offset=offset, limit=self.UPDATE_LIMIT, timeout=timeout,
+                allowed_updates=BotCommands.ALLOWED_UPDATES
+            )
+            if not updates:
+                self.logger.info('no updates')
+                break
             self.logger.info('processing %d updates', len(updates))
             aiogram.Bot.set_current(self.bot)
             await self.dispatcher.process_updates(updates)
             self.config['last_update_id'] = updates[-1].update_id
-        else:
-            self.logger.info('no updates')
+            self.stats['updates'] += len(updates)
+            if len(updates) < self.UPDATE_LIMIT:
+                break
+            timeout = 0
 
     async def process_link_updates(self) -> None:
+        profiler: Optional[cProfile.Profile] = self.profiler
+        if profiler is not None:
+            profiler.enable()
+        self.tracer.start_cycle()
+        try:
+            with self.tracer.span('cycle'):
+                await self._process_link_updates()
+        finally:
+            self.tracer.flush()
+            if profiler is not None:
+                profiler.disable()
+                self.profile_cycles -= 1
+                if self.profile_cycles <= 0:
+                    self.dump_profile()
+
+    def dump_profile(self) -> None:
+        if self.profiler is None:
+            return
+        self.logger.info('saving profile to %r', self.profile_path)
+        try:
+            self.profiler.dump_stats(self.profile_path)
+        except OSError as ex:
+            self.logger.error(
+                'error saving profile to %r: %r',
+                self.profile_path, ex, exc_info=ex
+            )
+        self.profiler = None
+
+    async def _process_link_updates(self) -> None:
         self.logger.info('processing link updates')
+        pending: Dict[int, List[Post]] = self.config.pop_pending()
+        if pending:
+            self.logger.info('creating pending posts')
+            await self.create_chat_posts(pending)
+            if not self.updating_links and self.started_updating_links:
+                return
+
         updates: Dict[int, List[Post]] = await self.process_links()
         self.logger.debug('got link updates %r', updates)
 
+        count: int = sum(len(posts) for posts in updates.values())
+        overload_posts: int = self.config['overload_posts']
+        overloaded: bool = 0 < overload_posts < count
+        if overloaded:
+            self.logger.warning(
+                'overloaded: %d new posts > %d', count, overload_posts
+            )
+        self.overloaded = overloaded
+
         self.logger.info('creating new posts')
-        results: List[Optional[Exception]] = await asyncio.gather(
-            *(self.create_posts(chat_id, posts)
-              for chat_id, posts in updates.items()),
-            return_exceptions=True
-        )
-        for chat_id, res in zip(updates.keys(), results):
-            if isinstance(res, (KeyboardInterrupt, asyncio.CancelledError)):
-                raise res
-            if isinstance(res, Exception):
-                self.logger.error(
-                    'error creating new posts in chat %r: %r',
-                    chat_id, res, exc_info=res
-                )
+        await self.create_chat_posts(updates, overloaded)
         self.logger.info('processed link updates')
 
+    async def create_chat_posts(self,
+                                updates: Dict[int, List[Post]],
+                                overloaded: bool = False) -> None:
+        self.pending = updates
+        self.delivering = True
+        try:
+            await self._create_chat_posts(updates, overloaded)
+        finally:
+            self.delivering = False
+        self.pending = {}
+
+    async def _create_chat_posts(self,
+                                 updates: Dict[int, List[Post]],
+                                 overloaded: bool) -> None:
+        shed_priority: int = self.config['shed_priority']
+        chat_priorities: Dict[int, int] = self.config.get_chat_priorities()
+        tiers: Dict[int, List[int]] = {}
+        for chat_id, posts in updates.items():
+            if posts:
+                tiers.setdefault(chat_priorities.get(chat_id, 0), []).append(
+                    chat_id
+                )
+        for priority in sorted(tiers, reverse=True):
+            chat_ids: List[int] = tiers[priority]
+            digest: bool = overloaded and priority < shed_priority
+            results: List[Optional[Exception]] = await asyncio.gather(
+                *(self.create_posts(chat_id, updates[chat_id], digest)
+                  for chat_id in chat_ids),
+                return_exceptions=True
+            )
+            for chat_id, res in zip(chat_ids, results):
+                if isinstance(
+                        res, (KeyboardInterrupt, asyncio.CancelledError)
+                ):
+                    raise res
+                if isinstance(res, Exception):
+                    self.stats['chat_errors'] += 1
+                    self.logger.error(
+                        'error creating new posts in chat %r: %r',
+                        chat_id, res, exc_info=res
+                    )
+
     async def process_links(self) -> Dict[int, List[Post]]:
         self.logger.info('processing links')
-        links: Dict[Link, str] = self.config.get_links()
-        results: List[Optional[Exception]] = await asyncio.gather(
-            *(self.loader.load(link, last_post_id)
-              for link, last_post_id in links.items()),
-            return_exceptions=True
-        )
-        self.logger.info('processed links %r', results)
+        await self.loader.check_proxies()
+        priorities: Dict[Link, int] = {}
+        with self.tracer.span('get_links'):
+            links: Dict[Link, int] = self.config.get_links(priorities)
+        # links cut off by the previous cycle timeout go first
+        # and are never shed
+        carry_over: Set[Link] = self.carry_over
+        boost: int = max(priorities.values(), default=0) + 1
+        for link in carry_over & links.keys():
+            priorities[link] = boost
+        if self.overloaded:
+            shed_priority: int = self.config['shed_priority']
+            count: int = len(links)
+            links = {
+                link: last_post_id for link, last_post_id in links.items()
+                if link in carry_over or priorities[link] >= shed_priority
+            }
+            self.logger.warning(
+                'overloaded: delaying %d links with priority < %d',
+                count - len(links), shed_priority
+            )
+        # proxies pace requests in the order the links are loaded
+        links = dict(sorted(
+            links.items(),
+            key=lambda item: (item[0] not in carry_over, -priorities[item[0]])
+        ))
+        tasks: List[asyncio.Task] = [
+            self.loop.create_task(self.loader.load(
+                link, last_post_id, priorities[link]
+            ))
+            for link, last_post_id in links.items()
+        ]
+        pending: Set[asyncio.Task] = set()
+        if tasks:
+            try:
+                _, pending = await asyncio.wait(
+                    tasks, timeout=self.config['cycle_timeout'] or None
+                )
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+        self.carry_over = set()
+        if pending:
+            self.logger.warning(
+                'cycle timeout: carrying over %d links', len(pending)
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
 
+        self.stats['links'] += len(links)
         posts: Dict[Link, List[Post]] = {}
-        for link, res in zip(links.keys(), results):
+        errors: int = 0
+        for link, task in zip(links.keys(), tasks):
+            if task in pending:
+                self.carry_over.add(link)
+                self.stats['link_timeouts'] += 1
+                continue
+            res: Any = task.exception() or task.result()
             self.logger.debug('link result %r %r', link, res)
             if isinstance(res, Exception):
+                errors += 1
+                self.stats['link_errors'] += 1
                 self.logger.error(
                     'error processing link %r: %r',
                     link, res, exc_info=res
                 )
-            elif res:
+                continue
+            if link in self.loader.validators:
+                self.config.set_link_validators(
+                    link, self.loader.validators[link]
+                )
+            if res:
                 posts[link] = res
             else:
                 self.config.set_link_update_time(link)
+        self.logger.info(
+            'processed %d links: %d updated, %d errors',
+            len(links), len(posts), errors
+        )
+        stats: Counter = self.loader.stats
+        self.logger.info(
+            'connections: %d created, %d reused (%.0f%%),'
+            ' dns cache: %d hits, %d misses',
+            stats['connections_created'], stats['connections_reused'],
+            100 * self.loader.get_reuse_ratio(),
+            stats['dns_cache_hits'], stats['dns_cache_misses']
+        )
+
+        with self.tracer.span('get_chat_posts'):
+            return self.config.get_chat_posts(posts)
 
-        return self.config.get_chat_posts(posts)
+    def prime_link(self,
+                   chat_id: int,
+                   link: Link,
+                   deliver: bool = True) -> None:
+        link_json: Optional[JsonObject] = self.config.get_link_config(
+            chat_id, link
+        )
+        if link_json is None:
+            return
+        # keep the regular update cycle off the link until it is primed
+        link_json['last_update_time'] = int(time.time())
+        self.config.mark_dirty()
+        task: asyncio.Task = self.loop.create_task(
+            self._prime_link(chat_id, link, link_json, deliver)
+        )
+        self._prime_tasks.add(task)
+        task.add_done_callback(self._prime_tasks.discard)
+
+    async def _prime_link(self,
+                          chat_id: int,
+                          link: Link,
+                          link_json: JsonObject,
+                          deliver: bool = True) -> None:
+        self.logger.info('priming link %r in chat %r', link, chat_id)
+        try:
+            posts: List[Post] = await self.loader.load(link)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.logger.error(
+                'error priming link %r: %r',
+                link, ex, exc_info=ex
+            )
+            link_json['last_update_time'] = 0
+            self.config.mark_dirty()
+            return
+        if not posts:
+            self.logger.info('no posts in link %r', link)
+            return
+
+        # parsers keep page order, so a pinned post can come last
+        posts = sorted(posts, key=lambda post: post.id)
+        count: int = self.config['link_prime_posts'] if deliver else 0
+        try:
+            if count > 0:
+                await self.create_posts(chat_id, posts[-count:])
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.logger.error(
+                'error creating posts in chat %r: %r',
+                chat_id, ex, exc_info=ex
+            )
+        finally:
+            if link_json.get('last_post_id', 0) < posts[-1].id:
+                link_json['last_post_id'] = posts[-1].id
+                self.config.mark_dirty()
+        self.logger.info(
+            'primed link %r in chat %r: last_post_id = %r',
+            link, chat_id, link_json['last_post_id']
+        )
 
     async def create_post(self, chat_id: int, post: Post) -> None:
         self.logger.info('creating post in %r: %r', chat_id, post)
-        msg: aiogram.types.Message = await self.bot.send_message(
-            chat_id, post.to_html(),
-            parse_mode=aiogram.types.ParseMode.HTML,
-            disable_web_page_preview=True
-        )
-        if post.image_urls:
-            for url in post.image_urls:
+        with self.tracer.span(
+                'create_post',
+                chat_id=chat_id,
+                link=self.tracer.format_link(post.link),
+                post_id=post.id
+        ):
+            await self._create_post(chat_id, post)
+
+    async def _create_post(self, chat_id: int, post: Post) -> None:
+        caption, texts = render_post(post)
+        image_urls: List[str] = post.image_urls
+        msg: Optional[aiogram.types.Message] = None
+        if caption is not None:
+            try:
+                msg = await self.pool.send(
+                    chat_id, 'send_photo', image_urls[0],
+                    caption=caption,
+                    parse_mode=aiogram.types.ParseMode.HTML
+                )
+                image_urls = image_urls[1:]
+            except aiogram.utils.exceptions.BadRequest as ex:
+                self.logger.error(
+                    'error sending photo %r: %r',
+                    image_urls[0], ex, exc_info=ex
+                )
+        if msg is None:
+            for text in texts:
+                msg_: aiogram.types.Message = await self.pool.send(
+                    chat_id, 'send_message', text,
+                    parse_mode=aiogram.types.ParseMode.HTML,
+                    disable_web_page_preview=True
+                )
+                msg = msg or msg_
+        if image_urls:
+            for url in image_urls:
                 try:
-                    await self.bot.send_photo(
-                        chat_id, url,
+                    await self.pool.send(
+                        chat_id, 'send_photo', url,
                         reply_to_message_id=msg.message_id
                     )
                 except Exception as ex:
@@ -202,10 +525,65 @@ class Bot:
                         url, ex, exc_info=ex
                     )
         self.config.update_last_post_id(chat_id, post)
+        self.stats['posts'] += 1
+
+    async def create_digest(self, chat_id: int, posts: List[Post]) -> None:
+        self.logger.info(
+            'creating digest of %d posts in %r', len(posts), chat_id
+        )
+        for text, batch in render_digest(
+                posts, self.config['digest_text_length']
+        ):
+            with self.tracer.span(
+                    'create_digest',
+                    chat_id=chat_id,
+                    link=self.tracer.format_link(batch[0].link),
+                    posts=len(batch)
+            ):
+                await self.pool.send(
+                    chat_id, 'send_message', text,
+                    parse_mode=aiogram.types.ParseMode.HTML,
+                    disable_web_page_preview=True
+                )
+            for post in batch:
+                self.config.update_last_post_id(chat_id, post)
+            self.stats['posts'] += len(batch)
+            self.stats['digests'] += 1
 
-    async def create_posts(self, chat_id: int, posts: List[Post]) -> None:
+    def skip_duplicates(self, chat_id: int, posts: List[Post]) -> List[Post]:
+        res: List[Post] = []
+        fingerprints: Set[int] = set()
         for post in posts:
-            await self.create_post(chat_id, post)
+            fingerprint: int = post.fingerprint()
+            if fingerprint and (
+                    fingerprint in fingerprints or
+                    self.config.is_duplicate(chat_id, fingerprint)
+            ):
+                self.logger.info(
+                    'skipping duplicate post in %r: %r', chat_id, post
+                )
+                self.config.update_last_post_id(chat_id, post)
+                self.stats['duplicates'] += 1
+                continue
+            fingerprints.add(fingerprint)
+            res.append(post)
+        return res
+
+    async def create_posts(self,
+                           chat_id: int,
+                           posts: List[Post],
+                           digest: bool = False) -> None:
+        for link, group in groupby(posts, key=lambda post: post.link):
+            link_posts: List[Post] = list(group)
+            threshold: int = self.config.get_digest_threshold(chat_id, link)
+            if digest or 0 < threshold <= len(link_posts):
+                link_posts = self.skip_duplicates(chat_id, link_posts)
+                if link_posts:
+                    await self.create_digest(chat_id, link_posts)
+                continue
+            for post in link_posts:
+                if self.skip_duplicates(chat_id, [post]):
+                    await self.create_post(chat_id, post)
 
     def save(self) -> None:
         self.logger.info('saving bot state')
@@ -213,6 +591,7 @@ class Bot:
 
     async def stop(self) -> None:
         self.logger.info('stopping bot')
+        await self.config.stop_checkpoints()
         stop = []
         if self.started_polling:
             self.logger.info('stop polling')
@@ -220,9 +599,20 @@ class Bot:
             self._poll_task.cancel()
             stop.append(self.dispatcher.wait_closed())
         if self.started_updating_links:
+            await self.drain()
             self.logger.info('stop updating links')
             self.stop_updating_links()
             stop.append(self.stopped_updating_links)
         if stop:
             await asyncio.gather(*stop)
-        await asyncio.gather(self.bot.close(), self.loader.close())
+        self.config.set_pending(self.pending)
+        self.pending = {}
+        self.dump_profile()
+        self.tracer.flush()
+        if self._prime_tasks:
+            self.logger.info('cancel link priming tasks')
+            for task in self._prime_tasks:
+                task.cancel()
+            await asyncio.wait(self._prime_tasks)
+        await asyncio.gather(self.pool.close(), self.loader.close())
+        self.save()
@@ -1,10 +1,16 @@
 import asyncio
 import logging
+from collections import Counter
+from logging.handlers import QueueListener
 from argparse import ArgumentParser, Namespace
+from typing import Tuple
 
 from .bot import Bot
+from .log import start_logging
 from .util import Arguments
 
+FAILURES: Tuple[str, ...] = ('link_errors', 'link_timeouts', 'chat_errors')
+
 def create_arg_parser() -> ArgumentParser:
     parser = ArgumentParser()
     parser.add_argument('config', metavar='FILE', help='config file')
@@ -23,7 +29,29 @@ def create_arg_parser() -> ArgumentParser:
         '-s', '--single-run',
         dest='watch',
         action='store_false',
-        help='(default)'
+        help=('process pending updates and due links, then exit,'
+              ' with status 2 if a link or a chat failed (default)')
+    )
+    parser.add_argument(
+        '-p', '--profile',
+        metavar='N',
+        type=int,
+        default=0,
+        help='profile N link update cycles'
+    )
+    parser.add_argument(
+        '-o', '--profile-output',
+        metavar='FILE',
+        default='bot.prof',
+        help='profile output file (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-r', '--log-rate',
+        metavar='N',
+        type=int,
+        default=100,
+        help=('max messages per minute with the same format,'
+              ' 0 for no limit (default: %(default)s)')
     )
     return parser
 
@@ -33,24 +61,38 @@ def parse_args(argv: Arguments = None) -> Namespace:
         return parser.parse_args(argv)
     return parser.parse_args()
 
-def main(argv: Arguments = None) -> None:
+def main(argv: Arguments = None) -> int:
     args: Namespace = parse_args(argv)
+    status: int = 0
 
-    logging.basicConfig(
-        level=args.log_level.upper(),
-        format=Bot.LOG_FORMAT
+    listener: QueueListener = start_logging(
+        args.log_level.upper(), Bot.LOG_FORMAT, args.log_rate
     )
-
-    logger: logging.Logger = logging.getLogger(__name__)
-    bot: Bot = Bot(args.config)
-    loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
-
     try:
-        loop.run_until_complete(bot.start() if args.watch else bot.run())
-    except KeyboardInterrupt:
-        logger.info('cancelled')
-    except Exception as ex:
-        logger.error('%r', ex, exc_info=ex)
+        logger: logging.Logger = logging.getLogger(__name__)
+        bot: Bot = Bot(
+            args.config,
+            profile_cycles=args.profile,
+            profile_path=args.profile_output
+        )
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+
+        try:
+            if args.watch:
+                loop.run_until_complete(bot.start())
+            else:
+                stats: Counter = loop.run_until_complete(bot.run())
+                if any(stats[key] for key in FAILURES):
+                    status = 2
+        except KeyboardInterrupt:
+            logger.info('cancelled')
+            status = 130
+        except Exception as ex:
+            logger.error('%r', ex, exc_info=ex)
+            status = 1
+        finally:
+            loop.run_until_complete(bot.stop())
+            loop.close()
     finally:
-        loop.run_until_complete(bot.stop())
-        loop.close()
+        listener.stop()
+    return status
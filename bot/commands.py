@@ -1,10 +1,12 @@
+import io
 import re
 import html
 import json
 import asyncio
 import logging
 from functools import wraps
-from typing import Optional, List, Tuple, Coroutine
+from xml.etree import ElementTree
+from typing import Optional, List, Tuple, Coroutine, Callable, Any
 
 import aiogram
 from aiogram.dispatcher.handler import SkipHandler
@@ -13,33 +15,102 @@ from .config import BotConfig
 from .link import Link
 from .util import CommandError, JsonObject
 
+def is_command_update(update: aiogram.types.Update) -> bool:
+    msg: Optional[aiogram.types.Message] = (
+        update.message or update.channel_post
+    )
+    return msg is not None and bool(msg.text) and msg.text.startswith('/')
+
+def parse_link_list(text: str) -> List[str]:
+    if text.lstrip().startswith('<'):
+        try:
+            root: ElementTree.Element = ElementTree.fromstring(text)
+        except ElementTree.ParseError as ex:
+            raise CommandError(f'invalid opml: {ex}')
+        return [
+            'feed:' + outline.get('xmlUrl') if outline.get('xmlUrl')
+            else outline.get('htmlUrl')
+            for outline in root.iter('outline')
+            if outline.get('xmlUrl') or outline.get('htmlUrl')
+        ]
+    return [
+        url
+        for line in text.splitlines()
+        if not line.lstrip().startswith('#')
+        for url in line.split()
+    ]
+
+def format_link_list(links: List[Link], title: str, opml: bool) -> bytes:
+    if not opml:
+        return ''.join(link.to_watch_url() + '\n' for link in links) \
+            .encode('utf-8')
+    root: ElementTree.Element = ElementTree.Element('opml', version='2.0')
+    ElementTree.SubElement(
+        ElementTree.SubElement(root, 'head'), 'title'
+    ).text = title
+    body: ElementTree.Element = ElementTree.SubElement(root, 'body')
+    for link in links:
+        url: str = link.to_url()
+        if link.type == 'feed':
+            ElementTree.SubElement(
+                body, 'outline', type='rss', text=url, xmlUrl=url
+            )
+        else:
+            ElementTree.SubElement(body, 'outline', text=url, htmlUrl=url)
+    return ElementTree.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+class CommandDispatcher(aiogram.Dispatcher):
+    async def process_updates(self,
+                              updates: List[aiogram.types.Update],
+                              fast: bool = True) -> List[Any]:
+        updates = [update for update in updates if is_command_update(update)]
+        if not updates:
+            return []
+        return await super().process_updates(updates, fast)
+
+
 class BotCommands:
+    ALLOWED_UPDATES: List[str] = ['message', 'channel_post']
+    MAX_IMPORT_SIZE: int = 1 << 20
+    MAX_INVALID_LINKS: int = 10
+
     HELP: str = '''
 commands:
     /start, /help - bot help
     /chatinfo - show chat info
 
 admin commands:
-    /watch &lt;url&gt; - add link to current chat
+    /watch &lt;url&gt; [url...] - add links to current chat
     /unwatch &lt;url&gt; - remove link from current chat
     /unwatch - remove all links from current chat
+    /import - add links from the replied text or opml file to current chat
+    /export [opml] - send links of current chat as a text or opml file
     /admin [user_id or reply] - add admin
     /admin [user_id or reply] false - remove admin
 
 admin commands in private chat:
-    /watch &lt;chat_id&gt; &lt;url&gt; - add link to chat by id
+    /watch &lt;chat_id&gt; &lt;url&gt; [url...] - add links to chat by id
     /unwatch &lt;chat_id&gt; &lt;url&gt; - remove link from chat by id
     /unwatch &lt;chat_id&gt;- remove all links from chat by id
+    /import &lt;chat_id&gt; - add links from the replied file to chat by id
+    /export &lt;chat_id&gt; [opml] - send links of chat by id as a file
 '''
 
     def __init__(self,
                  config: BotConfig,
                  dispatcher: aiogram.Dispatcher,
-                 username: str = ''):
+                 username: str = '',
+                 on_link_added: Optional[
+                     Callable[[int, Link, bool], None]
+                 ] = None):
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.config: BotConfig = config
         self.username: str = username
         self.dispatcher = dispatcher
+        self.on_link_added: Optional[
+            Callable[[int, Link, bool], None]
+        ] = on_link_added
 
         self.add_handler(self.match_command_username)
         self.add_handler(self.help, commands=['start', 'help'])
@@ -47,6 +118,8 @@ admin commands in private chat:
         self.add_handler(self.can_use_admin_commands)
         self.add_handler(self.watch, commands=['watch'])
         self.add_handler(self.unwatch, commands=['unwatch'])
+        self.add_handler(self.import_links, commands=['import'])
+        self.add_handler(self.export_links, commands=['export'])
         self.add_handler(self.admin, commands=['admin'])
 
     def add_handler(self, handler: Coroutine, *args, **kwargs) -> None:
@@ -177,6 +250,48 @@ admin commands in private chat:
 
         return chat_id, link
 
+    def _get_chat_args(self,
+                       msg: aiogram.types.Message,
+                       usage: str) -> Tuple[int, List[str]]:
+        args: List[str] = msg.get_args().split()
+        if msg.chat.type != aiogram.types.ChatType.PRIVATE:
+            return msg.chat.id, args
+        if not args:
+            raise CommandError(usage)
+        try:
+            return int(args[0]), args[1:]
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+    def _add_links(self, chat_id: int, urls: List[str]) -> str:
+        links: List[Link] = []
+        invalid: List[str] = []
+        for url in urls:
+            try:
+                links.append(Link.from_url(url))
+            except ValueError:
+                invalid.append(url)
+        added: List[Link] = self.config.add_links(chat_id, links)
+        if self.on_link_added is not None:
+            # only a single added link sends its latest posts, bulk adds
+            # just move the cursors past the existing posts
+            for link in added:
+                self.on_link_added(chat_id, link, len(added) == 1)
+        if len(urls) == 1 and not invalid:
+            if added:
+                return f'added {repr(added[0])} to chat {chat_id}'
+            return f'{repr(links[0])} already exists in chat {chat_id}'
+        res: str = (
+            f'added {len(added)} links to chat {chat_id},'
+            f' {len(links) - len(added)} already exist,'
+            f' {len(invalid)} invalid'
+        )
+        if invalid:
+            res += ':\n' + '\n'.join(invalid[:self.MAX_INVALID_LINKS])
+            if len(invalid) > self.MAX_INVALID_LINKS:
+                res += '\n...'
+        return res
+
     async def chat_info(self, msg: aiogram.types.Message):
         self.config.update_chat_info(msg.chat)
         chat_json: Optional[JsonObject] = self.config.get_chat_config(msg.chat.id)
@@ -198,10 +313,61 @@ admin commands in private chat:
         )
 
     async def watch(self, msg: aiogram.types.Message) -> str:
-        chat_id, link = self._get_watch_args(msg)
-        if self.config.add_link(chat_id, link):
-            return f'added {repr(link)} to chat {chat_id}'
-        return f'{repr(link)} already exists in chat {chat_id}'
+        usage: str = f'usage: {msg.get_command()}'
+        if msg.chat.type == aiogram.types.ChatType.PRIVATE:
+            usage += ' <chat_id>'
+        usage += ' <url> [url...]'
+        chat_id, urls = self._get_chat_args(msg, usage)
+        if not urls:
+            raise CommandError(usage)
+        return self._add_links(chat_id, urls)
+
+    async def import_links(self, msg: aiogram.types.Message) -> str:
+        usage: str = (
+            f'usage: reply to a text or opml file with {msg.get_command()}'
+        )
+        if msg.chat.type == aiogram.types.ChatType.PRIVATE:
+            usage += ' <chat_id>'
+        chat_id, args = self._get_chat_args(msg, usage)
+        reply: Optional[aiogram.types.Message] = msg.reply_to_message
+        if args or reply is None or reply.document is None:
+            raise CommandError(usage)
+        if (reply.document.file_size or 0) > self.MAX_IMPORT_SIZE:
+            raise CommandError(
+                f'file is too large: {reply.document.file_size}'
+                f' > {self.MAX_IMPORT_SIZE}'
+            )
+        data: io.BytesIO = await reply.document.download(
+            destination_file=io.BytesIO()
+        )
+        urls: List[str] = parse_link_list(
+            data.getvalue().decode('utf-8', 'replace')
+        )
+        if not urls:
+            raise CommandError('no links found')
+        return self._add_links(chat_id, urls)
+
+    async def export_links(self, msg: aiogram.types.Message) -> None:
+        usage: str = f'usage: {msg.get_command()}'
+        if msg.chat.type == aiogram.types.ChatType.PRIVATE:
+            usage += ' <chat_id>'
+        usage += ' [opml]'
+        chat_id, args = self._get_chat_args(msg, usage)
+        if len(args) > 1 or args and args[0].lower() != 'opml':
+            raise CommandError(usage)
+        opml: bool = bool(args)
+        chat: Optional[JsonObject] = self.config.get_chat_config(chat_id)
+        links: List[Link] = [
+            Link.from_json(link)
+            for link in (chat or {}).get('links', ())
+        ]
+        if not links:
+            raise CommandError(f'no links in chat {chat_id}')
+        data: bytes = format_link_list(links, f'chat {chat_id}', opml)
+        await msg.reply_document(aiogram.types.InputFile(
+            io.BytesIO(data),
+            filename=f'links-{chat_id}.{"opml" if opml else "txt"}'
+        ))
 
     async def unwatch(self, msg: aiogram.types.Message) -> str:
         chat_id, link = self._get_watch_args(msg, True)
@@ -1,28 +1,123 @@
 import os
+import sys
 import json
 import time
+import asyncio
 import logging
+import threading
 from copy import deepcopy
-from typing import Dict, Optional, Any, List
+from typing import (
+    Dict, Optional, Any, List, Tuple, Callable, Iterable, Set
+)
 
 import aiogram
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from .link import Link
 from .post import Post
-from .util import T, JsonObject
+from .seen import SeenPosts, SeenDigests, PostCursor
+from .util import JsonObject
+
+Path = Optional[Tuple[Any, Any]]
+Merge = Callable[[Any, Any, Path], Any]
 
 class BotConfigError(Exception):
     pass
 
+def json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(data: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        return json_dumpb(data, indent).decode('utf-8')
+    if indent:
+        return json.dumps(data, indent=2, sort_keys=False)
+    return json.dumps(data, separators=(',', ':'))
+
+def json_dumpb(data: Any, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 if indent else 0
+        )
+    return json_dumps(data, indent).encode('utf-8')
+
+def format_path(path: Path) -> str:
+    parts: List[str] = []
+    while path is not None:
+        path, key = path
+        parts.append(f'[{key}]' if isinstance(key, int) else f'.{key}')
+    return '<root>' + ''.join(reversed(parts))
+
+def check_type(default: Any, value: Any, path: Path) -> None:
+    number = (int, float)
+    if not (
+            isinstance(value, type(default)) or
+            isinstance(value, number) and isinstance(default, number)
+    ):
+        raise BotConfigError(
+            f'invalid type of {format_path(path)}:'
+            f' expected {type(default).__name__}, got {type(value).__name__}'
+        )
+
+def compile_schema(default: Any) -> Merge:
+    if isinstance(default, dict):
+        fields: Dict[str, Merge] = {
+            key: compile_schema(value) for key, value in default.items()
+        }
+        def merge_dict(dst: JsonObject, src: Any, path: Path) -> JsonObject:
+            check_type(dst, src, path)
+            for key, value in src.items():
+                try:
+                    merge: Merge = fields[key]
+                except KeyError:
+                    dst[key] = value
+                else:
+                    dst[key] = merge(dst[key], value, (path, key))
+            return dst
+        return merge_dict
+
+    if isinstance(default, list):
+        items: List[Merge] = [compile_schema(value) for value in default]
+        def merge_list(dst: List[Any], src: Any, path: Path) -> List[Any]:
+            check_type(dst, src, path)
+            for i, merge in enumerate(items[:len(src)]):
+                dst[i] = merge(dst[i], src[i], (path, i))
+            dst.extend(src[len(items):])
+            return dst
+        return merge_list
+
+    def merge_value(dst: Any, src: Any, path: Path) -> Any:
+        check_type(dst, src, path)
+        return src
+    return merge_value
+
 class BotConfig:
     DEFAULTS: JsonObject = {
         'token': '',
+        'bot_user': {},
+        'send_tokens': [],
         'proxy': '',
         'public_admin_commands_enabled': False,
         'last_update_id': -1,
         'update_timeout': 1,
         'link_update_interval': 86400,
+        'link_prime_posts': 1,
+        'seen_posts': 32,
+        'duplicate_window': 100,
+        'overload_posts': 500,
+        'shed_priority': 0,
+        'digest_text_length': 300,
         'connections_limit': 1,
+        'trace_path': '',
+        'save_interval': 60,
+        'drain_timeout': 10,
+        'cycle_timeout': 0,
+        'pending': [],
         'loader': {
             'user_agent': (
                 'Mozilla/5.0 (X11; Linux x86_64)'
@@ -34,93 +129,144 @@ class BotConfig:
             'max_connections': 1,
             'max_connections_per_host': 1,
             'max_workers': 1,
+            'vk_max_pages': 10,
+            'vk_page_concurrency': 2,
+            'vk_endpoint': 'desktop',
+            'proxies': [],
+            'proxy_max_failures': 3,
+            'proxy_retry_interval': 300,
+            'proxy_check_url': '',
             'cookies': {
+            },
+            'cassette': '',
+            'cassette_mode': 'record',
+            'cassette_latency': 0,
+            'dns_cache_ttl': 300,
+            'prewarm_connections': 0,
+            'timeouts': {
+                'default': {
+                    'connect': 10,
+                    'read': 30,
+                    'total': 120
+                }
             }
         },
         'admins': [],
         'chats': []
     }
+    SCHEMA: Merge = staticmethod(compile_schema(DEFAULTS))
 
     def __init__(self, path: str):
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.json: JsonObject = deepcopy(self.DEFAULTS)
         self.path: str = path
+        self.dirty: bool = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._save_lock: threading.Lock = threading.Lock()
+        self._save_seq: int = 0
+        self._saved_seq: int = 0
+        self._checkpoint_handle: Optional[asyncio.TimerHandle] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
         self.load()
 
     def __str__(self):
-        return json.dumps(self.json, indent=2, sort_keys=False)
+        return json_dumps(self.json, indent=True)
 
     def __getitem__(self, key: str) -> Any:
         return self.json[key]
 
     def __setitem__(self, key: str, value: Any) -> None:
         self.json[key] = value
+        self.mark_dirty()
 
     def get(self, key: str, default: Any = None) -> Any:
         return self.json.get(key, default)
 
     def load(self) -> None:
         self.logger.info('loading bot config from %r', self.path)
-        with open(self.path, 'r') as fp:
-            data = json.load(fp)
-        self.extend(self.json, data)
+        with open(self.path, 'rb') as fp:
+            data = json_loads(fp.read())
+        self.SCHEMA(self.json, data, None)
+        self.dirty = False
 
     def save(self, path: Optional[str] = None) -> None:
         path = path or self.path
-        tmp_path = path + '.tmp'
-        self.logger.info('saving bot config to %r', tmp_path)
-        data = str(self)
-        with open(tmp_path, 'w') as fp:
-            fp.write(data)
-        self.logger.info('renaming %r to %r', tmp_path, path)
-        os.rename(tmp_path, path)
-
-    def check_type(self, dst: Any, src: Any, path: str = '') -> None:
-        self.logger.debug('check_type %r %r %r', path, type(dst), type(src))
-        number = (int, float)
-        if not (
-                isinstance(src, type(dst)) or
-                isinstance(src, number) and isinstance(dst, number)
-        ):
-            raise BotConfigError(
-                f'invalid type of {path}:'
-                f' expected {type(dst).__name__}, got {type(src).__name__}'
+        if path == self.path:
+            if not self.dirty:
+                self.logger.info('bot config is not changed')
+                return
+            self.dirty = False
+        self._save_seq += 1
+        self.write(path, json_dumpb(self.json, indent=True), self._save_seq)
+
+    def write(self, path: str, data: bytes, seq: int) -> None:
+        with self._save_lock:
+            if path == self.path and seq < self._saved_seq:
+                self.logger.info('skipping outdated bot config %r', seq)
+                return
+            tmp_path = path + '.tmp'
+            self.logger.info('saving bot config to %r', tmp_path)
+            with open(tmp_path, 'wb') as fp:
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.logger.info('renaming %r to %r', tmp_path, path)
+            os.replace(tmp_path, path)
+            if path == self.path:
+                self._saved_seq = seq
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+        if (self.loop is not None and
+                self._checkpoint_handle is None and
+                self._checkpoint_task is None):
+            self._checkpoint_handle = self.loop.call_later(
+                self['save_interval'], self._start_checkpoint
             )
 
-    def extend(self, dst: T, src: T, path: str = '<root>') -> None:
-        self.logger.debug('extend %r %r %r', dst, src, path)
-        self.check_type(dst, src, path)
+    def start_checkpoints(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self['save_interval'] <= 0:
+            return
+        self.logger.info(
+            'saving bot config every %r seconds', self['save_interval']
+        )
+        self.loop = loop
+        if self.dirty:
+            self.mark_dirty()
 
-        if isinstance(dst, dict):
-            for key, value in src.items():
-                try:
-                    old_value = dst[key]
-                except KeyError:
-                    #self.logger.warning('unknown key %r in %s', key, path)
-                    dst[key] = value
-                    continue
-                path_ = f'{path}.{key}'
-                if isinstance(old_value, (dict, list)):
-                    self.extend(old_value, value, path_)
-                else:
-                    self.check_type(old_value, value, path_)
-                    dst[key] = value
-        elif isinstance(dst, list):
-            for i, value in enumerate(src):
-                path_ = f'{path}[{i}]'
-                if i >= len(dst):
-                    dst.append(value)
-                else:
-                    old_value = dst[i]
-                    if isinstance(old_value, (dict, list)):
-                        self.extend(old_value, value, path_)
-                    else:
-                        self.check_type(old_value, value, path_)
-                        dst[i] = value
-        else:
-            raise TypeError(
-                f'can not extend object of type {type(dst).__name__}'
+    async def stop_checkpoints(self) -> None:
+        self.loop = None
+        if self._checkpoint_handle is not None:
+            self._checkpoint_handle.cancel()
+            self._checkpoint_handle = None
+        if self._checkpoint_task is not None:
+            await asyncio.wait([self._checkpoint_task])
+
+    def _start_checkpoint(self) -> None:
+        self._checkpoint_handle = None
+        self._checkpoint_task = self.loop.create_task(self.checkpoint())
+
+    async def checkpoint(self) -> None:
+        loop: asyncio.AbstractEventLoop = self.loop
+        try:
+            if not self.dirty:
+                return
+            self.dirty = False
+            # serialize once on the loop thread, write in a worker;
+            # indenting disables the C encoder of json, so checkpoints
+            # are compact and only the final save is indented
+            data: bytes = json_dumpb(self.json)
+            self._save_seq += 1
+            await loop.run_in_executor(
+                None, self.write, self.path, data, self._save_seq
             )
+        except Exception as ex:
+            self.logger.error('error saving bot config: %r', ex, exc_info=ex)
+            self.dirty = True
+        finally:
+            self._checkpoint_task = None
+            if self.dirty:
+                self.mark_dirty()
 
     def is_admin(self, user_id: int) -> bool:
         return user_id in self['admins']
@@ -129,17 +275,22 @@ class BotConfig:
         if self.is_admin(user_id):
             return False
         self['admins'].append(user_id)
+        self.mark_dirty()
         return True
 
     def remove_admin(self, user_id: int) -> bool:
         try:
             self['admins'].remove(user_id)
+            self.mark_dirty()
             return True
         except ValueError:
             return False
 
     def has_link(self, chat_id: int, link: Link) -> bool:
-        links: List[Link] = self.get_chat_config(chat_id).get('links', [])
+        chat: Optional[JsonObject] = self.get_chat_config(chat_id)
+        if chat is None:
+            return False
+        links: List[JsonObject] = chat.get('links', [])
         return link in links
 
     def get_chat_config(self,
@@ -161,6 +312,7 @@ class BotConfig:
                 'links': []
             }
             chats.append(chat_json)
+            self.mark_dirty()
             return chat_json
 
     def update_chat_info(self,
@@ -176,46 +328,127 @@ class BotConfig:
             chat_json['shifted_id'] = chat_json['id']
         chat_json['mention'] = chat.mention
         chat_json['title'] = chat.full_name
+        self.mark_dirty()
         #chat_json['url'] = await chat.get_url()
 
+    def get_link_config(self,
+                        chat_id: int,
+                        link: Link) -> Optional[JsonObject]:
+        chat: Optional[JsonObject] = self.get_chat_config(chat_id)
+        if chat is None:
+            return None
+        try:
+            return next(link_ for link_ in chat.get('links', ())
+                        if link == link_)
+        except StopIteration:
+            return None
+
+    def get_digest_threshold(self, chat_id: int, link: Link) -> int:
+        chat: Optional[JsonObject] = self.get_chat_config(chat_id)
+        if chat is None:
+            return 0
+        link_json: Optional[JsonObject] = self.get_link_config(chat_id, link)
+        if link_json is not None and 'digest' in link_json:
+            return link_json['digest']
+        return chat.get('digest', 0)
+
     def add_link(self, chat_id: int, link: Link) -> bool:
-        if self.has_link(chat_id, link):
-            return False
-        self.get_chat_config(chat_id, True)['links'].append(link.to_json())
-        return True
+        return bool(self.add_links(chat_id, [link]))
+
+    def add_links(self, chat_id: int, links: Iterable[Link]) -> List[Link]:
+        chat_links: List[JsonObject] = (
+            self.get_chat_config(chat_id, True)['links']
+        )
+        existing: Set[Link] = {Link.from_json(link) for link in chat_links}
+        added: List[Link] = []
+        for link in links:
+            if link not in existing:
+                existing.add(link)
+                chat_links.append(link.to_json())
+                added.append(link)
+        if added:
+            self.mark_dirty()
+        return added
 
     def remove_link(self, chat_id: int, link: Link) -> bool:
         try:
             self.get_chat_config(chat_id, True)['links'].remove(link)
+            self.mark_dirty()
             return True
         except ValueError:
             return False
 
     def remove_all_links(self, chat_id: int) -> None:
         self.get_chat_config(chat_id, True)['links'] = []
+        self.mark_dirty()
+
+    def get_seen_posts(self, link: JsonObject) -> SeenPosts:
+        return SeenPosts.decode(self['seen_posts'], link.get('seen', ''))
+
+    def get_fingerprints(self, chat: JsonObject) -> SeenDigests:
+        return SeenDigests.decode(
+            self['duplicate_window'], chat.get('fingerprints', '')
+        )
+
+    def is_duplicate(self, chat_id: int, fingerprint: int) -> bool:
+        if not fingerprint or self['duplicate_window'] <= 0:
+            return False
+        chat: Optional[JsonObject] = self.get_chat_config(chat_id)
+        return chat is not None and fingerprint in self.get_fingerprints(chat)
 
-    def get_links(self) -> Dict[Link, int]:
+    @staticmethod
+    def get_priority(chat: JsonObject, link: JsonObject) -> int:
+        return link.get('priority', chat.get('priority', 0))
+
+    def get_chat_priorities(self) -> Dict[int, int]:
+        return {
+            chat['id']: chat.get('priority', 0)
+            for chat in self.get('chats', ())
+        }
+
+    def get_links(self,
+                  priorities: Optional[Dict[Link, int]] = None,
+                  current_time: Optional[int] = None) -> Dict[Link, int]:
         update_interval: int = self['link_update_interval']
-        current_time: int = int(time.time())
+        if current_time is None:
+            current_time = int(time.time())
         self.logger.info('getting links')
-        res: Dict[Link, int] = {}
+        cursors: Dict[Link, List[Any]] = {}
+        skipped: int = 0
         for chat in self.get('chats', ()):
             for link in chat.get('links', ()):
                 link_: Link = Link.from_json(link)
                 last_post_id: int = link.get('last_post_id', 0)
                 last_update_time: int = link.get('last_update_time', 0)
                 if current_time - last_update_time < update_interval:
-                    self.logger.info(
+                    skipped += 1
+                    self.logger.debug(
                         'skipping link %r in chat %r: %r < %r',
                         link, chat['id'],
                         current_time - last_update_time, update_interval
                     )
                     continue
-                if link_ in res:
-                    res[link_] = min(res[link_], last_post_id)
+                if priorities is not None:
+                    priorities[link_] = max(
+                        priorities.get(link_, -sys.maxsize),
+                        self.get_priority(chat, link)
+                    )
+                seen: SeenPosts = self.get_seen_posts(link)
+                floor: int = seen.floor(last_post_id)
+                try:
+                    cursor: List[Any] = cursors[link_]
+                except KeyError:
+                    cursors[link_] = [last_post_id, floor, set(seen)]
                 else:
-                    res[link_] = last_post_id
-        self.logger.info('got links %r', res)
+                    cursor[0] = min(cursor[0], last_post_id)
+                    cursor[1] = min(cursor[1], floor)
+                    cursor[2].intersection_update(seen)
+        res: Dict[Link, int] = {
+            link: PostCursor(last_post_id, floor, frozenset(seen))
+            for link, (last_post_id, floor, seen) in cursors.items()
+        }
+        self.logger.info('got %d links, skipped %d', len(res), skipped)
+        self.logger.debug('got links %r', res)
         return res
 
     def get_chat_posts(self,
@@ -228,14 +461,59 @@ class BotConfig:
             res[chat_id] = dst
             for link in chat.get('links', ()):
                 link_: Link = Link.from_json(link)
+                if link_ not in posts:
+                    continue
                 last_post_id: int = link.get('last_post_id', 0)
-                src: List[Post] = [post for post in posts.get(link_, [])
-                                   if post.id > last_post_id]
+                seen: SeenPosts = self.get_seen_posts(link)
+                floor: int = seen.floor(last_post_id)
+                src: List[Post] = [
+                    post for post in posts[link_]
+                    if post.id > floor and post.id not in seen
+                ]
                 if src:
                     dst.extend(src)
                 else:
                     link['last_update_time'] = int(time.time())
-        self.logger.info('got new posts %r', res)
+                    self.mark_dirty()
+        self.logger.info(
+            'got %d new posts in %d chats',
+            sum(len(posts) for posts in res.values()),
+            sum(1 for posts in res.values() if posts)
+        )
+        self.logger.debug('got new posts %r', res)
+        return res
+
+    def is_post_sent(self, chat_id: int, post: Post) -> bool:
+        link: Optional[JsonObject] = self.get_link_config(chat_id, post.link)
+        if link is None:
+            return True
+        seen: SeenPosts = self.get_seen_posts(link)
+        return (
+            post.id <= seen.floor(link.get('last_post_id', 0)) or
+            post.id in seen
+        )
+
+    def set_pending(self, pending: Dict[int, List[Post]]) -> None:
+        res: List[JsonObject] = [
+            {'chat': chat_id, 'post': post.to_json()}
+            for chat_id, posts in pending.items()
+            for post in posts
+            if not self.is_post_sent(chat_id, post)
+        ]
+        self.logger.info('saving %d pending posts', len(res))
+        if res or self['pending']:
+            self['pending'] = res
+
+    def pop_pending(self) -> Dict[int, List[Post]]:
+        res: Dict[int, List[Post]] = {}
+        for item in self['pending']:
+            try:
+                post: Post = Post.from_json(item['post'])
+                res.setdefault(item['chat'], []).append(post)
+            except (KeyError, ValueError) as ex:
+                self.logger.error('invalid pending post %r: %r', item, ex)
+        if self['pending']:
+            self['pending'] = []
         return res
 
     def update_last_post_id(self, chat_id: int, post: Post) -> None:
@@ -246,13 +524,42 @@ class BotConfig:
             )
         links: JsonObject = chat.get('links', ())
         link: JsonObject = links[links.index(post.link)]
-        link['last_post_id'] = post.id
+        link['last_post_id'] = max(link.get('last_post_id', 0), post.id)
         link['last_update_time'] = int(time.time())
+        if self['seen_posts'] > 0:
+            seen: SeenPosts = self.get_seen_posts(link)
+            seen.add(post.id)
+            link['seen'] = seen.encode()
+        fingerprint: int = post.fingerprint()
+        if fingerprint and self['duplicate_window'] > 0:
+            fingerprints: SeenDigests = self.get_fingerprints(chat)
+            if fingerprint not in fingerprints:
+                fingerprints.add(fingerprint)
+                chat['fingerprints'] = fingerprints.encode()
+        self.mark_dirty()
+
+    def get_link_validators(self) -> Dict[Link, Dict[str, str]]:
+        return {
+            Link.from_json(link): link['validators']
+            for chat in self.get('chats', ())
+            for link in chat.get('links', ())
+            if 'validators' in link
+        }
+
+    def set_link_validators(self,
+                            link: Link,
+                            validators: Dict[str, str]) -> None:
+        for chat in self.get('chats', ()):
+            for link_ in chat.get('links', ()):
+                if link == link_ and link_.get('validators') != validators:
+                    link_['validators'] = dict(validators)
+                    self.mark_dirty()
 
     def set_link_update_time(self, link: Link) -> None:
         timestamp = int(time.time())
-        self.logger.info('set link update time %r %r', link, timestamp)
+        self.logger.debug('set link update time %r %r', link, timestamp)
         for chat in self.get('chats', ()):
             for link_ in chat.get('links', ()):
                 if link == link_:
                     link_['last_update_time'] = timestamp
+        self.mark_dirty()
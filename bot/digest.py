@@ -0,0 +1,47 @@
+from typing import List, Tuple
+
+from .post import Post
+from .render import (
+    MAX_MESSAGE_LENGTH, utf16_len, split_html, safe_html, render_link
+)
+
+
+def truncate(text: str, length: int) -> str:
+    if utf16_len(text) <= length:
+        return text
+    if length <= 0:
+        return ''
+    return split_html(text, length - 1)[0] + '…'
+
+def render_entry(post: Post, text_length: int) -> str:
+    entry: str = render_link(post)
+    text: str = truncate(safe_html(post.text), text_length)
+    if text:
+        entry += '\n' + text
+    return entry
+
+def render_digest(
+        posts: List[Post],
+        text_length: int,
+        max_length: int = MAX_MESSAGE_LENGTH
+) -> List[Tuple[str, List[Post]]]:
+    messages: List[Tuple[str, List[Post]]] = []
+    entries: List[str] = []
+    batch: List[Post] = []
+    length: int = 0
+    for post in posts:
+        entry: str = render_entry(post, text_length)
+        if utf16_len(entry) > max_length:
+            entry = render_entry(post, 0)
+        if utf16_len(entry) > max_length:
+            entry = split_html(entry, max_length)[0]
+        size: int = utf16_len(entry)
+        if batch and length + 2 + size > max_length:
+            messages.append(('\n\n'.join(entries), batch))
+            entries, batch, length = [], [], 0
+        length += size + (2 if entries else 0)
+        entries.append(entry)
+        batch.append(post)
+    if batch:
+        messages.append(('\n\n'.join(entries), batch))
+    return messages
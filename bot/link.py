@@ -8,7 +8,9 @@ class Link(NamedTuple):
     LINK_TO_URL = {
         'hb': 'http://httpbin.org/{0}',
         'vk': 'https://vk.com/{0}',
-        'ig': 'https://instagram.com/{0}'
+        'ig': 'https://instagram.com/{0}',
+        'feed': '{0}',
+        'synth': 'synth:{0}'
     }
 
     NETLOC_TO_TYPE = {
@@ -39,6 +41,11 @@ class Link(NamedTuple):
         except KeyError:
             raise ValueError(f'unknown link type: {repr(self.type)}')
 
+    def to_watch_url(self) -> str:
+        if self.type == 'feed':
+            return 'feed:' + self.id
+        return self.to_url()
+
     @classmethod
     def from_json(cls: Type, json: Dict[str, str]):
         try:
@@ -52,6 +59,15 @@ class Link(NamedTuple):
         id_: Optional[str] = None
         parsed_url: ParseResult = urlparse(url)
 
+        if parsed_url.scheme == 'feed':
+            id_ = url[5:]
+            if id_.startswith('//'):
+                id_ = 'https:' + id_
+            return cls('feed', id_)
+
+        if parsed_url.scheme == 'synth':
+            return cls('synth', url[6:])
+
         try:
             type_ = cls.NETLOC_TO_TYPE[parsed_url.netloc] # pylint:disable=no-member
             id_ = parsed_url.path[1:]
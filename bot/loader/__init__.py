@@ -1,10 +1,21 @@
 from .loader import Loader
 
 from .hb import parse_hb
-from .vk import parse_vk
-from .ig import load_ig, parse_ig
+from .vk import load_vk, parse_vk, get_url as get_vk_url
+from .ig import load_ig, parse_ig, dump_ig, restore_ig
+from .feed import load_feed, parse_feed
+from .synth import load_synth, parse_synth
 
 Loader.add_parser('hb', parse_hb)
+Loader.add_url('hb', Loader.url_default)
+Loader.add_loader('vk', load_vk)
 Loader.add_parser('vk', parse_vk)
-Loader.add_loader('ig', load_ig)
+Loader.add_url('vk', get_vk_url)
+Loader.add_loader('ig', load_ig, executor=True)
 Loader.add_parser('ig', parse_ig)
+Loader.add_serializer('ig', dump_ig, restore_ig)
+Loader.add_loader('feed', load_feed)
+Loader.add_parser('feed', parse_feed)
+Loader.add_url('feed', Loader.url_default)
+Loader.add_loader('synth', load_synth)
+Loader.add_parser('synth', parse_synth)
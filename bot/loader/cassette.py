@@ -0,0 +1,92 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Any
+
+from ..link import Link
+from ..util import Number, JsonObject
+
+class Cassette:
+    MODES = ('record', 'replay')
+    VERSION: int = 2
+    MAX_ENTRIES: int = 16
+
+    def __init__(self, path: str, mode: str, latency: Number = 0):
+        if mode not in self.MODES:
+            raise ValueError(f'invalid cassette mode: {repr(mode)}')
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.path: str = path
+        self.mode: str = mode
+        self.latency: Number = latency
+        # link key -> last post id of the request -> response
+        self.entries: Dict[str, Dict[str, JsonObject]] = {}
+        if self.replaying:
+            self.load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    @staticmethod
+    def get_key(link: Link) -> str:
+        return f'{link.type}:{link.id}'
+
+    def load(self) -> None:
+        self.logger.info('loading cassette from %r', self.path)
+        with gzip.open(self.path, 'rt', encoding='utf-8') as fp:
+            data: JsonObject = json.load(fp)
+        if data.get('version') != self.VERSION:
+            raise ValueError(
+                f'unsupported cassette version: {repr(data.get("version"))}'
+            )
+        self.entries = data['entries']
+
+    def save(self) -> None:
+        if not self.recording:
+            return
+        tmp_path: str = self.path + '.tmp'
+        self.logger.info('saving cassette to %r', tmp_path)
+        data: JsonObject = {
+            'version': self.VERSION,
+            'entries': self.entries
+        }
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fp:
+            json.dump(data, fp, separators=(',', ':'))
+        self.logger.info('renaming %r to %r', tmp_path, self.path)
+        os.replace(tmp_path, self.path)
+
+    def record(self, link: Link, last_post_id: int, content: Any) -> None:
+        entries: Dict[str, JsonObject] = self.entries.setdefault(
+            self.get_key(link), {}
+        )
+        request: str = str(int(last_post_id))
+        # a repeated request replaces its response and becomes the newest
+        entries.pop(request, None)
+        entries[request] = {
+            'time': int(time.time()),
+            'content': content
+        }
+        while len(entries) > self.MAX_ENTRIES:
+            del entries[next(iter(entries))]
+
+    async def replay(self, link: Link, last_post_id: int) -> Any:
+        key: str = self.get_key(link)
+        try:
+            entries: Dict[str, JsonObject] = self.entries[key]
+        except KeyError:
+            raise ValueError(f'no recorded responses for {key}')
+        entry: JsonObject
+        try:
+            entry = entries[str(int(last_post_id))]
+        except KeyError:
+            entry = entries[list(entries)[-1]]
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return entry['content']
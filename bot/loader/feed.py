@@ -0,0 +1,157 @@
+import re
+import html
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Dict, AsyncIterator
+from xml.etree import ElementTree
+
+from ..link import Link
+from ..post import Post
+from ..util import JsonObject
+from .loader import Loader
+from .proxy import Proxy
+
+
+CHUNK_SIZE: int = 16384
+ENTRY_TAGS = frozenset(('item', 'entry'))
+DATE_TAGS = ('published', 'pubDate', 'updated', 'date')
+TEXT_TAGS = ('summary', 'description', 'content', 'encoded')
+TAG_RE = re.compile(r'<[^>]+>')
+BREAK_RE = re.compile(r'<\s*(br|/p|/div|/li)\b[^>]*>', re.IGNORECASE)
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def parse_date(value: str) -> int:
+    value = value.strip()
+    date: datetime
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+def html_to_text(value: str) -> str:
+    value = BREAK_RE.sub('\n', value)
+    value = html.unescape(TAG_RE.sub('', value))
+    return '\n'.join(line.strip() for line in value.splitlines()
+                     if line.strip())
+
+def parse_entry(loader: Loader, entry: ElementTree.Element) -> JsonObject:
+    fields: Dict[str, str] = {}
+    url: str = ''
+    images: List[str] = []
+
+    for child in entry:
+        name: str = local_name(child.tag)
+        if name == 'link':
+            href: Optional[str] = child.get('href')
+            if href is None:
+                url = url or (child.text or '').strip()
+            elif child.get('rel', 'alternate') == 'alternate':
+                url = url or href
+            elif (child.get('rel') == 'enclosure' and
+                  child.get('type', '').startswith('image/')):
+                images.append(href)
+        elif name == 'enclosure':
+            if child.get('type', '').startswith('image/') and child.get('url'):
+                images.append(child.get('url'))
+        elif name in ('content', 'thumbnail') and child.get('url'):
+            if child.get('medium', 'image') == 'image':
+                images.append(child.get('url'))
+        elif child.text and name not in fields:
+            fields[name] = child.text
+
+    post_id: int = 0
+    for name in DATE_TAGS:
+        try:
+            post_id = parse_date(fields[name])
+            break
+        except KeyError:
+            pass
+        except ValueError as ex:
+            loader.logger.warning('invalid date %r: %r', fields[name], ex)
+    text: str = next(
+        (html_to_text(fields[name]) for name in TEXT_TAGS if name in fields),
+        ''
+    )
+
+    return {
+        'id': post_id,
+        'url': url,
+        'title': html_to_text(fields.get('title', '')) or url,
+        'text': text,
+        'images': list(dict.fromkeys(images))
+    }
+
+async def load_feed(loader: Loader,
+                    link: Link,
+                    last_post_id: int,
+                    proxy: Proxy) -> List[JsonObject]:
+    url: str = link.to_url()
+    headers: Dict[str, str] = {}
+    validators: Dict[str, str] = loader.validators.get(link, {})
+    # only skip the feed if every entry of the cached response was delivered
+    if last_post_id >= int(validators.get('max_post_id', 0)):
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    entries: List[JsonObject] = []
+    async with proxy.session.get(
+            url, headers=headers, timeout=loader.get_timeout(link.type)
+    ) as response:
+        if response.status == 304:
+            loader.logger.debug('feed %r is not modified', link)
+            return entries
+
+        parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(
+            events=('end',)
+        )
+        done: bool = False
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if local_name(elem.tag) not in ENTRY_TAGS:
+                    continue
+                entry: JsonObject = parse_entry(loader, elem)
+                elem.clear()
+                if entry['id'] <= 0:
+                    loader.logger.warning('no date in feed entry %r', entry)
+                    continue
+                if entry['id'] <= last_post_id:
+                    done = True
+                    break
+                entries.append(entry)
+            if done:
+                break
+
+        validators = {
+            'max_post_id': str(max(
+                (entry['id'] for entry in entries), default=last_post_id
+            ))
+        }
+        if 'ETag' in response.headers:
+            validators['etag'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            validators['last_modified'] = response.headers['Last-Modified']
+        loader.validators[link] = validators
+
+    entries.sort(key=lambda entry: entry['id'])
+    return entries
+
+async def parse_feed(loader: Loader,
+                     link: Link,
+                     content: List[JsonObject],
+                     last_post_id: int) -> AsyncIterator[Post]:
+    for entry in content:
+        if entry['id'] > last_post_id:
+            yield Post(
+                link, entry['id'], entry['url'],
+                html.escape(entry['title']), html.escape(entry['text']),
+                entry['images']
+            )
@@ -1,6 +1,6 @@
 import html
 import time
-from typing import List
+from typing import AsyncIterator
 
 from ..link import Link
 from ..post import Post
@@ -10,9 +10,12 @@ from .loader import Loader
 async def parse_hb(loader: Loader,
                    link: Link,
                    content: str,
-                   last_post_id: int) -> List[Post]:
-    return [Post(
-        link, int(time.time()), link.to_url(),
+                   last_post_id: int) -> AsyncIterator[Post]:
+    post_id: int = int(time.time())
+    if post_id <= last_post_id:
+        return
+    yield Post(
+        link, post_id, link.to_url(),
         html.escape(repr(link)), f'<code>{html.escape(content)}</code>',
         ['https://via.placeholder.com/64', 'https://via.placeholder.com/128']
-    )]
+    )
@@ -1,6 +1,6 @@
 import html
 import time
-from typing import List
+from typing import List, Dict, Optional, AsyncIterator, Any
 from datetime import datetime
 from itertools import takewhile
 
@@ -11,29 +11,36 @@ except ImportError:
 
 from ..link import Link
 from ..post import Post
+from ..util import JsonObject, Number
 from .loader import Loader
+from .proxy import Proxy
 
-def get_instaloader(loader: Loader) -> instaloader.Instaloader:
+def get_instaloader(loader: Loader,
+                    proxy: Optional[str] = None) -> instaloader.Instaloader:
     if instaloader is None:
         raise RuntimeError(f'instaloader is not installed')
-    ret: instaloader.Instaloader = instaloader.Instaloader()
-    if loader.proxy is not None:
+    timeouts: Dict[str, Number] = loader.get_timeouts('ig')
+    ret: instaloader.Instaloader = instaloader.Instaloader(
+        request_timeout=timeouts.get('read') or timeouts.get('total') or 300
+    )
+    if proxy is not None:
         ret.context._session.proxies.update({ # pylint:disable=protected-access
-            'http': loader.proxy,
-            'https': loader.proxy,
+            'http': proxy,
+            'https': proxy,
         })
     return ret
 
 def load_ig_sync(
         loader: Loader,
         link: Link,
-        last_post_id: int
+        last_post_id: int,
+        proxy: Optional[str] = None
 ) -> List[instaloader.Post]:
     if last_post_id <= 0:
         last_post_id = int(time.time()) - 172800 #604800
     last_post_date: datetime = datetime.utcfromtimestamp(last_post_id)
 
-    iloader: instaloader.Instaloader = get_instaloader(loader)
+    iloader: instaloader.Instaloader = get_instaloader(loader, proxy)
 
     profile: instaloader.Profile
     try:
@@ -60,11 +67,39 @@ def load_ig_sync(
 
 async def load_ig(loader: Loader,
                   link: Link,
-                  last_post_id: int) -> List[instaloader.Post]:
+                  last_post_id: int,
+                  proxy: Proxy) -> List[instaloader.Post]:
     return await loader.run_in_executor(
-        load_ig_sync, loader, link, last_post_id
+        load_ig_sync, loader, link, last_post_id, proxy.url
     )
 
+def dump_ig(loader: Loader,
+            link: Link,
+            content: List[instaloader.Post]) -> List[JsonObject]:
+    return [
+        {
+            'node': post._node, # pylint:disable=protected-access
+            'sidecar_nodes': [list(node) for node in post.sidecar_nodes]
+        }
+        for post in content
+    ]
+
+def restore_ig(loader: Loader,
+               link: Link,
+               data: List[JsonObject]) -> List[instaloader.Post]:
+    iloader: instaloader.Instaloader = get_instaloader(loader)
+    posts: List[instaloader.Post] = []
+    for post_json in data:
+        post: instaloader.Post = instaloader.Post(
+            iloader.context, post_json['node']
+        )
+        sidecar_nodes: List[Any] = post_json['sidecar_nodes']
+        post.sidecar_nodes = [
+            instaloader.PostSidecarNode(*node) for node in sidecar_nodes
+        ]
+        posts.append(post)
+    return posts
+
 def parse_post(link: Link, post: instaloader.Post) -> Post:
     post_id: int = int(post.date_utc.timestamp())
     url: str = f'https://instagram.com/p/{post.shortcode}/'
@@ -87,5 +122,7 @@ def parse_post(link: Link, post: instaloader.Post) -> Post:
 async def parse_ig(loader: Loader,
                    link: Link,
                    content: List[instaloader.Post],
-                   last_post_id: int) -> List[Post]:
-    return [parse_post(link, post) for post in content]
+                   last_post_id: int) -> AsyncIterator[Post]:
+    for post in content:
+        if int(post.date_utc.timestamp()) > last_post_id:
+            yield parse_post(link, post)
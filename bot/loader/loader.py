@@ -1,8 +1,14 @@
-import random
+import zlib
+import time
 import asyncio
+import inspect
 import logging
+from collections import Counter
 from concurrent.futures import Executor, ThreadPoolExecutor
-from typing import Optional, Dict, List, Type, Any, Coroutine, Callable
+from typing import (
+    Optional, Dict, List, Type, Any, Coroutine, Callable, AsyncIterator,
+    Iterable, Tuple, Set
+)
 
 import yarl
 import aiohttp
@@ -13,122 +19,378 @@ except ImportError:
 
 from ..link import Link
 from ..post import Post
-from ..util import Number, Cookies
+from ..trace import Tracer
+from ..util import Number, Cookies, PrioritySemaphore
+from .cassette import Cassette
+from .proxy import Proxy
 
 class Loader:
+    # link types loaded in the executor: a load timeout leaves the thread
+    # running and says nothing about the proxy
+    executor_types: Set[str] = set()
+
     def __init__(self,
                  loop: Optional[asyncio.AbstractEventLoop] = None,
                  proxy: Optional[str] = None,
+                 proxies: Optional[List[str]] = None,
+                 proxy_max_failures: int = 3,
+                 proxy_retry_interval: Number = 300,
+                 proxy_check_url: str = '',
                  user_agent: Optional[str] = None,
                  min_delay: Number = 0.5,
                  max_delay: Number = 1,
                  max_connections: int = 10,
                  max_connections_per_host: int = 1,
                  max_workers: int = 1,
-                 cookies: Optional[Cookies] = None):
+                 vk_max_pages: int = 10,
+                 vk_page_concurrency: int = 2,
+                 vk_endpoint: str = 'desktop',
+                 cookies: Optional[Cookies] = None,
+                 cassette: str = '',
+                 cassette_mode: str = 'record',
+                 cassette_latency: Number = 0,
+                 timeouts: Optional[Dict[str, Dict[str, Number]]] = None,
+                 dns_cache_ttl: Number = 300,
+                 prewarm_connections: int = 0,
+                 validators: Optional[Dict[Link, Dict[str, str]]] = None,
+                 tracer: Optional[Tracer] = None):
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+        self.tracer: Tracer = tracer or Tracer()
+        self.cassette: Optional[Cassette] = None
+        if cassette:
+            self.cassette = Cassette(cassette, cassette_mode, cassette_latency)
         self.executor: Executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.min_delay: Number = min_delay
-        self.max_delay: Number = max_delay
+        self.vk_max_pages: int = vk_max_pages
+        self.vk_page_concurrency: int = vk_page_concurrency
+        self.vk_endpoint: str = vk_endpoint
 
         self.headers: Dict[str, str] = {}
         if user_agent is not None:
             self.headers['User-Agent'] = user_agent
 
-        self.cookie_jar: aiohttp.CookieJar = aiohttp.CookieJar(unsafe=True)
-        if cookies is not None:
-            for url, url_cookies in cookies.items():
-                self.cookie_jar.update_cookies(
-                    url_cookies,
-                    yarl.URL(url) if url else None
-                )
+        self.validators: Dict[Link, Dict[str, str]] = validators or {}
+        self.timeouts: Dict[str, Dict[str, Number]] = timeouts or {}
+        self.client_timeouts: Dict[str, aiohttp.ClientTimeout] = {}
+
+        self.cookies: Cookies = cookies or {}
+
+        self.stats: Counter = Counter()
+        self.trace_config: aiohttp.TraceConfig = aiohttp.TraceConfig()
+        self.trace_config.on_connection_create_end.append(
+            self.count('connections_created')
+        )
+        self.trace_config.on_connection_reuseconn.append(
+            self.count('connections_reused')
+        )
+        self.trace_config.on_dns_cache_hit.append(self.count('dns_cache_hits'))
+        self.trace_config.on_dns_cache_miss.append(
+            self.count('dns_cache_misses')
+        )
 
-        self.proxy: Optional[str] = proxy
-        self.connector_class: Type = aiohttp.TCPConnector
+        self.proxy: Optional[str] = proxy or None
+        self.proxy_check_url: str = proxy_check_url
+        self.max_connections_per_host: int = max_connections_per_host
+        self.prewarm_connections: int = prewarm_connections
         self.connector_kwargs: Dict[str, Any] = dict(
             loop=self.loop,
             limit=max_connections,
-            limit_per_host=max_connections_per_host
+            limit_per_host=max_connections_per_host,
+            ttl_dns_cache=dns_cache_ttl or None,
+            use_dns_cache=dns_cache_ttl > 0
         )
+        self.proxies: List[Proxy] = [
+            Proxy(
+                str(i), url, self.create_session(url),
+                proxy_max_failures, proxy_retry_interval,
+                min_delay, max_delay
+            )
+            for i, url in enumerate(proxies or [self.proxy])
+        ]
+        self.slots: PrioritySemaphore = PrioritySemaphore(
+            max_connections * len(self.proxies)
+        )
+
+    def create_session(self, proxy: Optional[str]) -> aiohttp.ClientSession:
+        connector_class: Type = aiohttp.TCPConnector
+        connector_kwargs: Dict[str, Any] = dict(self.connector_kwargs)
         if proxy:
             if aiohttp_socks is None:
                 raise ValueError('install aiohttp_socks for proxy support')
             (proxy_type, host, port,
              username, password) = aiohttp_socks.utils.parse_proxy_url(proxy)
-            self.connector_class = aiohttp_socks.ProxyConnector
-            self.connector_kwargs.update(
+            connector_class = aiohttp_socks.ProxyConnector
+            connector_kwargs.update(
                 proxy_type=proxy_type, host=host, port=port,
                 username=username, password=password
             )
-        self.connector: aiohttp.BaseConnector = self.connector_class(
-            **self.connector_kwargs
-        )
-
-        self.session: aiohttp.ClientSession = aiohttp.ClientSession(
-            connector=self.connector,
-            cookie_jar=self.cookie_jar,
+        # cookies set through one proxy must not leak to the others
+        cookie_jar: aiohttp.CookieJar = aiohttp.CookieJar(unsafe=True)
+        for url, url_cookies in self.cookies.items():
+            cookie_jar.update_cookies(
+                url_cookies,
+                yarl.URL(url) if url else None
+            )
+        return aiohttp.ClientSession(
+            connector=connector_class(**connector_kwargs),
+            cookie_jar=cookie_jar,
             headers=self.headers,
+            timeout=self.get_timeout('default'),
+            trace_configs=[self.trace_config],
             raise_for_status=True
         )
 
+    def count(self, key: str) -> Callable[..., Coroutine]:
+        async def on_event(*_) -> None:
+            self.stats[key] += 1
+        return on_event
+
+    def get_reuse_ratio(self) -> float:
+        created: int = self.stats['connections_created']
+        reused: int = self.stats['connections_reused']
+        return reused / (created + reused) if created + reused else 0
+
+    async def prewarm(self, links: Iterable[Link]) -> None:
+        hosts: Counter = Counter()
+        for link in links:
+            try:
+                get_url: Callable[[Link], str] = getattr(
+                    self, 'url_' + link.type
+                )
+            except AttributeError:
+                continue
+            url: yarl.URL = yarl.URL(get_url(link))
+            if url.scheme in ('http', 'https') and url.host:
+                hosts[self.get_proxy(link), url.origin()] += 1
+        requests: List[Tuple[Proxy, yarl.URL]] = []
+        for (proxy, origin), count in hosts.most_common():
+            count = min(
+                count, self.max_connections_per_host,
+                self.prewarm_connections - len(requests)
+            )
+            requests.extend((proxy, origin) for _ in range(count))
+            if len(requests) >= self.prewarm_connections:
+                break
+        if not requests:
+            return
+        self.logger.info(
+            'opening %d connections to %d hosts', len(requests), len(hosts)
+        )
+        results: List[Any] = await asyncio.gather(*(
+            self.prewarm_connection(proxy, origin)
+            for proxy, origin in requests
+        ), return_exceptions=True)
+        for res in results:
+            if isinstance(res, Exception):
+                self.logger.debug('error opening connection: %r', res)
+
+    async def prewarm_connection(self, proxy: Proxy, origin: yarl.URL) -> None:
+        async with proxy.session.head(
+                origin, allow_redirects=False, raise_for_status=False
+        ):
+            pass
+
+    def get_timeouts(self, link_type: str) -> Dict[str, Number]:
+        timeouts: Dict[str, Number] = dict(self.timeouts.get('default', {}))
+        timeouts.update(self.timeouts.get(link_type, {}))
+        return timeouts
+
+    def get_timeout(self, link_type: str) -> aiohttp.ClientTimeout:
+        try:
+            return self.client_timeouts[link_type]
+        except KeyError:
+            pass
+        timeouts: Dict[str, Number] = self.get_timeouts(link_type)
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=timeouts.get('connect') or None,
+            sock_read=timeouts.get('read') or None
+        )
+        self.client_timeouts[link_type] = timeout
+        return timeout
+
+    def get_proxy(self, link: Link) -> Proxy:
+        if len(self.proxies) == 1:
+            return self.proxies[0]
+        now: float = time.monotonic()
+        proxies: List[Proxy] = [
+            proxy for proxy in self.proxies if proxy.is_available(now)
+        ] or self.proxies
+        key: str = f'{link.type}:{link.id}'
+        return max(
+            proxies,
+            key=lambda proxy: zlib.crc32(f'{proxy.url}|{key}'.encode())
+        )
+
+    @staticmethod
+    def is_proxy_error(ex: Exception) -> bool:
+        if isinstance(ex, aiohttp.ClientResponseError):
+            return ex.status in (403, 429) or ex.status >= 500
+        if aiohttp_socks is not None and isinstance(ex, (
+                aiohttp_socks.ProxyError,
+                aiohttp_socks.ProxyConnectionError,
+                aiohttp_socks.ProxyTimeoutError
+        )):
+            return True
+        return isinstance(ex, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    async def check_proxy(self, proxy: Proxy) -> None:
+        self.logger.info('checking proxy %s', proxy.name)
+        try:
+            async with proxy.session.get(self.proxy_check_url):
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            proxy.failed(ex)
+        else:
+            proxy.succeeded()
+
+    async def check_proxies(self) -> None:
+        if not self.proxy_check_url:
+            return
+        await asyncio.gather(*(
+            self.check_proxy(proxy) for proxy in self.proxies
+            if proxy.failures
+        ))
+
     async def close(self) -> None:
         self.logger.info('closing %s', self.__class__.__name__)
-        await self.session.close()
+        await asyncio.gather(*(proxy.session.close() for proxy in self.proxies))
         self.executor.shutdown()
+        if self.cassette is not None:
+            self.cassette.save()
         # https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
         await asyncio.sleep(0.25)
 
-    async def wait(self) -> None:
-        delay: float = random.random() * (self.max_delay - self.min_delay)
-        delay += self.min_delay
-        await asyncio.sleep(delay)
-
     async def run_in_executor(self, func: Callable, *args):
         return await self.loop.run_in_executor(self.executor, func, *args)
 
     async def load(self,
                    link: Link,
-                   last_post_id: int = 0) -> List[Post]:
-        try:
-            func: str = 'load_' + link.type
-            do_load: Coroutine = getattr(self, func)
-        except AttributeError:
-            do_load = self.load_default
+                   last_post_id: int = 0,
+                   priority: int = 0) -> List[Post]:
+        link_name: str = self.tracer.format_link(link)
+        content: Any
+        if self.cassette is not None and self.cassette.replaying:
+            with self.tracer.span('load', link=link_name):
+                content = self.restore(
+                    link, await self.cassette.replay(link, last_post_id)
+                )
+        else:
+            try:
+                func: str = 'load_' + link.type
+                do_load: Coroutine = getattr(self, func)
+            except AttributeError:
+                do_load = self.load_default
 
-        await self.wait()
-        content: Any = await do_load(link, last_post_id)
-        return await self.parse(link, content, last_post_id)
+            proxy: Proxy = self.get_proxy(link)
+            async with self.slots.slot(priority):
+                await proxy.wait()
+                with self.tracer.span(
+                        'load', link=link_name, proxy=proxy.name
+                ):
+                    total: Optional[Number] = (
+                        self.get_timeouts(link.type).get('total') or None
+                    )
+                    try:
+                        content = await asyncio.wait_for(
+                            do_load(link, last_post_id, proxy), total
+                        )
+                    except asyncio.TimeoutError as ex:
+                        if link.type not in self.executor_types:
+                            proxy.failed(ex)
+                        raise
+                    except Exception as ex:
+                        if self.is_proxy_error(ex):
+                            proxy.failed(ex)
+                        raise
+                    proxy.succeeded()
+            if self.cassette is not None:
+                self.cassette.record(
+                    link, last_post_id, self.dump(link, content)
+                )
+        with self.tracer.span('parse', link=link_name):
+            return [
+                post async for post in self.parse(link, content, last_post_id)
+            ]
 
     async def parse(self,
                     link: Link,
-                    content: str,
-                    last_post_id: int) -> List[Post]:
+                    content: Any,
+                    last_post_id: int) -> AsyncIterator[Post]:
         try:
             func: str = 'parse_' + link.type
-            parse: Coroutine = getattr(self, func)
-            if not asyncio.iscoroutinefunction(parse):
-                raise AttributeError('%r is not an async function' % func)
+            parse: Callable[..., AsyncIterator[Post]] = getattr(self, func)
+            if not inspect.isasyncgenfunction(parse):
+                raise AttributeError(
+                    '%r is not an async generator function' % func
+                )
         except AttributeError as ex:
             self.logger.error(
                 'no parse function for link type: %r',
                 link, exc_info=ex
             )
-            return []
-        else:
-            return await parse(link, content, last_post_id)
+            return
+        async for post in parse(link, content, last_post_id):
+            yield post
 
-    async def load_default(self, link: Link, last_post_id: int) -> str:
+    def dump(self, link: Link, content: Any) -> Any:
+        try:
+            dump: Callable[[Link, Any], Any] = getattr(self, 'dump_' + link.type)
+        except AttributeError:
+            return content
+        return dump(link, content)
+
+    def restore(self, link: Link, data: Any) -> Any:
+        try:
+            restore: Callable[[Link, Any], Any] = getattr(
+                self, 'restore_' + link.type
+            )
+        except AttributeError:
+            return data
+        return restore(link, data)
+
+    def url_default(self, link: Link) -> str:
+        return link.to_url()
+
+    async def load_default(self,
+                           link: Link,
+                           last_post_id: int,
+                           proxy: Proxy) -> str:
         url: str = link.to_url()
-        async with self.session.get(url) as response:
+        async with proxy.session.get(
+                url, timeout=self.get_timeout(link.type)
+        ) as response:
             return await response.text()
 
     @classmethod
-    def add_loader(cls: Type, link_type: str, load: Coroutine) -> None:
+    def add_loader(cls: Type,
+                   link_type: str,
+                   load: Coroutine,
+                   executor: bool = False) -> None:
         func = f'load_{link_type}'
         setattr(cls, func, load)
+        if executor:
+            cls.executor_types.add(link_type)
 
     @classmethod
-    def add_parser(cls: Type, link_type: str, parse: Coroutine) -> None:
+    def add_parser(cls: Type,
+                   link_type: str,
+                   parse: Callable[..., AsyncIterator[Post]]) -> None:
         func = f'parse_{link_type}'
         setattr(cls, func, parse)
+
+    @classmethod
+    def add_url(cls: Type,
+                link_type: str,
+                get_url: Callable[..., str]) -> None:
+        setattr(cls, f'url_{link_type}', get_url)
+
+    @classmethod
+    def add_serializer(cls: Type,
+                       link_type: str,
+                       dump: Callable[..., Any],
+                       restore: Callable[..., Any]) -> None:
+        setattr(cls, f'dump_{link_type}', dump)
+        setattr(cls, f'restore_{link_type}', restore)
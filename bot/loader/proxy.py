@@ -0,0 +1,64 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from ..util import Number
+
+class Proxy:
+    def __init__(self,
+                 name: str,
+                 url: Optional[str],
+                 session: aiohttp.ClientSession,
+                 max_failures: int = 3,
+                 retry_interval: Number = 300,
+                 min_delay: Number = 0,
+                 max_delay: Number = 0):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.name: str = name
+        self.url: Optional[str] = url
+        self.session: aiohttp.ClientSession = session
+        self.max_failures: int = max_failures
+        self.retry_interval: Number = retry_interval
+        self.min_delay: Number = min_delay
+        self.max_delay: Number = max_delay
+        self.failures: int = 0
+        self.down_until: float = 0
+        self.next_request: float = 0
+
+    def __repr__(self) -> str:
+        return f'<Proxy {self.name} failures={self.failures}>'
+
+    def is_available(self, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        return self.down_until <= now
+
+    async def wait(self) -> None:
+        now: float = time.monotonic()
+        start: float = max(now, self.next_request)
+        delay: float = random.random() * (self.max_delay - self.min_delay)
+        self.next_request = start + delay + self.min_delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def succeeded(self) -> None:
+        if self.failures:
+            self.logger.info('proxy %s is up', self.name)
+        self.failures = 0
+        self.down_until = 0
+
+    def failed(self, error: Exception) -> None:
+        self.failures += 1
+        self.logger.warning(
+            'proxy %s failed (%d/%d): %r',
+            self.name, self.failures, self.max_failures, error
+        )
+        if self.failures >= self.max_failures:
+            self.logger.error(
+                'proxy %s is down for %ss', self.name, self.retry_interval
+            )
+            self.down_until = time.monotonic() + self.retry_interval
@@ -0,0 +1,99 @@
+import html
+import time
+import zlib
+import random
+import asyncio
+from functools import lru_cache
+from urllib.parse import parse_qsl
+from typing import List, Dict, AsyncIterator
+
+from ..link import Link
+from ..post import Post
+from ..seen import is_new
+from ..util import JsonObject, Number
+from .loader import Loader
+from .proxy import Proxy
+
+
+PARAMS: Dict[str, Number] = {
+    'posts': 1,
+    'page': 0,
+    'text': 100,
+    'images': 0,
+    'latency': 0,
+    'errors': 0
+}
+WORDS: List[str] = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod'
+    ' tempor incididunt ut labore et dolore magna aliqua'
+).split()
+
+
+@lru_cache(maxsize=1024)
+def get_params(link_id: str) -> Dict[str, Number]:
+    params: Dict[str, Number] = dict(PARAMS)
+    for key, value in parse_qsl(link_id):
+        if key not in params:
+            continue
+        try:
+            params[key] = type(PARAMS[key])(value)
+        except ValueError:
+            params[key] = float(value)
+    return params
+
+def get_seed(link_id: str) -> str:
+    return f'{zlib.crc32(link_id.encode("utf-8")):08x}'
+
+# links loaded at the same time get the same post ids: mix in the link
+def get_text(seed: str, post_id: int, size: int) -> str:
+    words: List[str] = [str(post_id), seed]
+    length: int = len(words[0]) + len(seed) + 2
+    i: int = post_id + int(seed, 16)
+    while length < size:
+        word: str = WORDS[i % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        i = i * 7 + 3
+    return ' '.join(words)[:size]
+
+async def load_synth(loader: Loader,
+                     link: Link,
+                     last_post_id: int,
+                     proxy: Proxy) -> List[JsonObject]:
+    params: Dict[str, Number] = get_params(link.id)
+    seed: str = get_seed(link.id)
+    if params['latency'] > 0:
+        await asyncio.sleep(params['latency'])
+    if random.random() < params['errors']:
+        raise ConnectionError(f'synthetic error in {link!r}')
+    posts: int = int(params['posts'])
+    page: int = max(int(params['page']), posts)
+    top: int = (
+        last_post_id + posts if last_post_id > 0
+        else int(time.time() * 1000)
+    )
+    return [
+        {
+            'id': post_id,
+            'text': get_text(seed, post_id, int(params['text'])),
+            'images': [
+                f'https://example.com/synth/{seed}/{post_id}/{i}.jpg'
+                for i in range(int(params['images']))
+            ]
+        }
+        for post_id in range(top, top - page, -1)
+    ]
+
+async def parse_synth(loader: Loader,
+                      link: Link,
+                      content: List[JsonObject],
+                      last_post_id: int) -> AsyncIterator[Post]:
+    seed: str = get_seed(link.id)
+    for entry in reversed(content):
+        if is_new(entry['id'], last_post_id):
+            yield Post(
+                link, entry['id'],
+                f'https://example.com/synth/{seed}/{entry["id"]}',
+                html.escape(link.id), html.escape(entry['text']),
+                entry['images']
+            )
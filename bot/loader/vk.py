@@ -1,17 +1,115 @@
 import re
 import html
-from typing import List, Optional
+import asyncio
+from typing import (
+    List, Optional, Tuple, Union, Set, Iterable, Iterator, AsyncIterator
+)
 
 import bs4
 import yarl
+import aiohttp
 
 from ..link import Link
 from ..post import Post
+from ..seen import is_new
 from .loader import Loader
+from .proxy import Proxy
+from . import vk_mobile
 
 
 Element = bs4.BeautifulSoup
 
+ENDPOINTS = ('desktop', 'mobile')
+MOBILE_URL: str = 'https://m.vk.com/{0}'
+POST_ID_RE = re.compile(r'\bid="post-?\d+_(\d+)"')
+POST_STRAINER = bs4.SoupStrainer(class_=re.compile(r'(^|\s)post(\s|$)'))
+
+
+def get_post_ids(content: str) -> List[int]:
+    return [int(post_id) for post_id in POST_ID_RE.findall(content)]
+
+def get_page_post_ids(loader: Loader, content: str) -> List[int]:
+    if loader.vk_endpoint == 'mobile':
+        return vk_mobile.get_post_ids(content)
+    return get_post_ids(content)
+
+def get_url(loader: Loader, link: Link) -> str:
+    if loader.vk_endpoint not in ENDPOINTS:
+        raise ValueError(f'unknown vk endpoint: {repr(loader.vk_endpoint)}')
+    if loader.vk_endpoint == 'mobile':
+        return MOBILE_URL.format(link.id)
+    return link.to_url()
+
+async def load_page(session: aiohttp.ClientSession,
+                    url: str,
+                    timeout: aiohttp.ClientTimeout,
+                    offset: int = 0,
+                    own: bool = False) -> str:
+    # the wall offset is only honoured for the owner's posts
+    params = {'own': '1', 'offset': str(offset)} if own else None
+    async with session.get(url, params=params, timeout=timeout) as response:
+        return await response.text()
+
+async def load_vk(loader: Loader,
+                  link: Link,
+                  last_post_id: int,
+                  proxy: Proxy) -> List[str]:
+    url: str = get_url(loader, link)
+    session: aiohttp.ClientSession = proxy.session
+    timeout: aiohttp.ClientTimeout = loader.get_timeout(link.type)
+    page: str = await load_page(session, url, timeout)
+    pages: List[str] = [page]
+    post_ids: List[int] = get_page_post_ids(loader, page)
+    if last_post_id <= 0 or not post_ids or post_ids[-1] <= last_post_id:
+        return pages
+
+    # the first page can have visitor posts that owner offsets skip:
+    # count pages from the first page of owner posts
+    await proxy.wait()
+    page = await load_page(session, url, timeout, own=True)
+    seen: Set[int] = set(post_ids)
+    post_ids = get_page_post_ids(loader, page)
+    if not seen.issuperset(post_ids):
+        pages.append(page)
+    seen.update(post_ids)
+    if not post_ids or post_ids[-1] <= last_post_id:
+        return pages
+
+    page_size: int = len(post_ids)
+    offset: int = page_size
+    while len(pages) < loader.vk_max_pages:
+        count: int = min(
+            loader.vk_page_concurrency,
+            loader.vk_max_pages - len(pages)
+        )
+        loader.logger.info(
+            'loading %d more pages of %r from offset %d',
+            count, link, offset
+        )
+        await proxy.wait()
+        batch: List[str] = await asyncio.gather(*(
+            load_page(session, url, timeout, offset + i * page_size, True)
+            for i in range(count)
+        ))
+        for i, page in enumerate(batch):
+            post_ids = get_page_post_ids(loader, page)
+            if post_ids and seen.issuperset(post_ids):
+                loader.logger.warning(
+                    'no new posts in %r at offset %d',
+                    link, offset + i * page_size
+                )
+                return pages
+            seen.update(post_ids)
+            pages.append(page)
+            if not post_ids or post_ids[-1] <= last_post_id:
+                return pages
+        offset += count * page_size
+
+    loader.logger.warning(
+        'reached %d pages of %r before post %r',
+        loader.vk_max_pages, link, last_post_id
+    )
+    return pages
 
 def parse_image(loader: Loader, img: Element) -> Optional[str]:
     style = img['style']
@@ -21,41 +119,45 @@ def parse_image(loader: Loader, img: Element) -> Optional[str]:
         return None
     return match.group(1)
 
-def parse_post(loader: Loader, link: Link, post: Element) -> Post:
-    post_id: int = -1
-    url: str = ''
-    title: str = ''
-    text: str = ''
-    images: List[str] = []
-
-    base_url = yarl.URL(link.to_url() + '/')
-
+def parse_post_id(post: Element) -> Tuple[str, int]:
     post_full_id: str = post['id']
     if post_full_id.startswith('post-'):
         post_full_id = post_full_id[5:]
     parts: List[str] = post_full_id.split('_')
     if len(parts) != 2:
         raise ValueError('invalid post id: %r' % post_full_id)
-    post_id = int(parts[1])
+    return post_full_id, int(parts[1])
 
-    link: Optional[Element] = post.find('a', class_='post_link')
-    if link is not None:
-        url = str(base_url.join(yarl.URL(link['href'])))
+def parse_post(loader: Loader,
+               link: Link,
+               post: Element,
+               post_full_id: str,
+               post_id: int) -> Post:
+    url: str = ''
+    title: str = ''
+    text: str = ''
+    images: List[str] = []
+
+    base_url = yarl.URL(link.to_url() + '/')
+
+    link_: Optional[Element] = post.find('a', class_='post_link')
+    if link_ is not None:
+        url = str(base_url.join(yarl.URL(link_['href'])))
     else:
-        loader.logger.warning('no link found in post %r', post)
+        loader.logger.warning('no link found in post %r', post_full_id)
 
     title_: Optional[Element] = post.find('a', class_='author')
     if title_ is not None:
         title = title_.string
         if title is None:
             title = post_full_id
-            loader.logger.warning('no title found in post %r', post)
+            loader.logger.warning('no title found in post %r', post_full_id)
     else:
         title = post_full_id
-        loader.logger.warning('no title found in post %r', post)
+        loader.logger.warning('no title found in post %r', post_full_id)
 
     text_: Optional[Element] = post.find(class_='wall_post_text')
-    if text is not None:
+    if text_ is not None:
         expand: Optional[Element] = text_.find(class_='wall_post_more')
         if expand is not None:
             expand.decompose()
@@ -67,16 +169,50 @@ def parse_post(loader: Loader, link: Link, post: Element) -> Post:
     ]
 
     if not (text or images):
-        loader.logger.error('empty post: %r', post)
+        loader.logger.error('empty post: %r', post_full_id)
 
     return Post(
         link, post_id, url, html.escape(title), html.escape(text), images
     )
 
-async def parse_vk(loader: Loader, link: Link,
-                   content: str, last_post_id: int) -> List[Post]:
-    page: Element = bs4.BeautifulSoup(content, 'html.parser')
+def parse_page(loader: Loader,
+               link: Link,
+               content: str,
+               last_post_id: int) -> Iterator[Post]:
+    page: Element = bs4.BeautifulSoup(
+        content, 'html.parser', parse_only=POST_STRAINER
+    )
     posts: List[Element] = page.find_all(class_='post')
     if not posts:
-        loader.logger.error('no posts found in %r', page)
-    return [parse_post(loader, link, post) for post in reversed(posts)]
+        loader.logger.error('no posts found in %r', link)
+        return
+    for post in reversed(posts):
+        post_full_id, post_id = parse_post_id(post)
+        if is_new(post_id, last_post_id):
+            yield parse_post(loader, link, post, post_full_id, post_id)
+
+async def parse_vk(loader: Loader, link: Link,
+                   content: Union[str, List[str]],
+                   last_post_id: int) -> AsyncIterator[Post]:
+    pages: List[str] = [content] if isinstance(content, str) else content
+    seen: Set[int] = set()
+    for content_ in reversed(pages):
+        post_ids: List[int] = get_page_post_ids(loader, content_)
+        if post_ids and not any(
+                is_new(post_id, last_post_id) for post_id in post_ids
+        ):
+            loader.logger.debug(
+                'no new posts in %r: %r <= %r',
+                link, max(post_ids), last_post_id
+            )
+            continue
+
+        posts: Iterable[Post]
+        if loader.vk_endpoint == 'mobile':
+            posts = vk_mobile.parse_page(loader, link, content_, last_post_id)
+        else:
+            posts = parse_page(loader, link, content_, last_post_id)
+        for post in posts:
+            if post.id not in seen:
+                seen.add(post.id)
+                yield post
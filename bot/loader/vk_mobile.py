@@ -0,0 +1,184 @@
+import re
+import html
+from html.parser import HTMLParser
+from collections import Counter
+from typing import List, Optional, Tuple, Dict
+
+import yarl
+
+from ..link import Link
+from ..post import Post
+from ..seen import is_new
+from .loader import Loader
+
+
+POST_ID_RE = re.compile(r'\bname="post-?\d+_(\d+)"')
+ANCHOR_RE = re.compile(r'^post(-?\d+_(\d+))$')
+IMAGE_URL_RE = re.compile(r'url\(([^)]+)\)')
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+))
+# elements whose end tag may be omitted
+OPTIONAL_END_ELEMENTS = frozenset((
+    'p', 'li', 'dt', 'dd', 'option', 'optgroup', 'tr', 'td', 'th',
+    'thead', 'tbody', 'tfoot', 'rt', 'rp', 'colgroup'
+))
+
+Attributes = List[Tuple[str, Optional[str]]]
+
+
+def get_post_ids(content: str) -> List[int]:
+    return [int(post_id) for post_id in POST_ID_RE.findall(content)]
+
+
+class MobilePost:
+    __slots__ = ('full_id', 'id', 'url', 'title', 'text', 'images', 'skip')
+
+    def __init__(self):
+        self.full_id: str = ''
+        self.id: int = -1
+        self.url: str = ''
+        self.title: List[str] = []
+        self.text: List[str] = []
+        self.images: List[str] = []
+        self.skip: bool = False
+
+
+class MobileWallParser(HTMLParser):
+    def __init__(self, last_post_id: int):
+        super().__init__(convert_charrefs=True)
+        self.last_post_id: int = last_post_id
+        self.posts: List[MobilePost] = []
+        self.post: Optional[MobilePost] = None
+        # open elements of the current post: (tag, role)
+        self.stack: List[Tuple[str, str]] = []
+        self.roles: Counter = Counter()
+
+    def handle_starttag(self, tag: str, attrs: Attributes) -> None:
+        attrs_: Dict[str, str] = {
+            key: value for key, value in attrs if value is not None
+        }
+        classes: List[str] = attrs_.get('class', '').split()
+
+        if 'wall_item' in classes:
+            self.end_post()
+            self.post = MobilePost()
+            self.stack.append((tag, ''))
+            return
+        if self.post is None:
+            return
+        role: str = self.handle_post_element(attrs_, classes)
+        if tag in VOID_ELEMENTS or tag in OPTIONAL_END_ELEMENTS and not role:
+            return
+        self.stack.append((tag, role))
+        self.roles[role] += 1
+
+    def handle_startendtag(self, tag: str, attrs: Attributes) -> None:
+        if self.post is not None:
+            attrs_: Dict[str, str] = {
+                key: value for key, value in attrs if value is not None
+            }
+            self.handle_post_element(attrs_, attrs_.get('class', '').split())
+
+    def handle_post_element(self,
+                            attrs: Dict[str, str],
+                            classes: List[str]) -> str:
+        post: MobilePost = self.post
+        anchor: Optional[str] = attrs.get('name')
+        if anchor is not None and post.id < 0:
+            match = ANCHOR_RE.match(anchor)
+            if match is not None:
+                post.full_id = match.group(1)
+                post.id = int(match.group(2))
+                post.skip = not is_new(post.id, self.last_post_id)
+        if post.skip:
+            return ''
+
+        role: str = ''
+        if 'pi_author' in classes:
+            role = 'title'
+        elif 'pi_text' in classes:
+            role = 'text'
+        elif 'pi_text_more' in classes and self.roles['text']:
+            role = 'more'
+        elif 'wi_date' in classes and 'href' in attrs:
+            post.url = attrs['href']
+
+        style: str = attrs.get('style', '')
+        if 'thumb_map_img' in classes and style:
+            match = IMAGE_URL_RE.search(style)
+            if match is not None:
+                post.images.append(match.group(1).strip('\'"'))
+        return role
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.post is None or tag in VOID_ELEMENTS:
+            return
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                break
+        else:
+            if tag not in OPTIONAL_END_ELEMENTS:
+                # a parent of the post is closed
+                self.end_post()
+            return
+        for _, role in self.stack[i:]:
+            self.roles[role] -= 1
+        del self.stack[i:]
+        if not self.stack:
+            self.end_post()
+
+    def end_post(self) -> None:
+        if self.post is not None and self.post.id >= 0:
+            self.posts.append(self.post)
+        self.post = None
+        self.stack.clear()
+        self.roles.clear()
+
+    def close(self) -> None:
+        super().close()
+        self.end_post()
+
+    def handle_data(self, data: str) -> None:
+        if self.post is None or self.post.skip:
+            return
+        data = data.strip()
+        if not data:
+            return
+        if self.roles['title']:
+            self.post.title.append(data)
+        elif self.roles['text'] and not self.roles['more']:
+            self.post.text.append(data)
+
+
+def parse_page(loader: Loader,
+               link: Link,
+               content: str,
+               last_post_id: int) -> List[Post]:
+    parser: MobileWallParser = MobileWallParser(last_post_id)
+    parser.feed(content)
+    parser.close()
+    if not parser.posts:
+        loader.logger.error('no posts found in %r', link)
+        return []
+
+    base_url = yarl.URL(link.to_url() + '/')
+    res: List[Post] = []
+    for post in reversed(parser.posts):
+        if post.skip:
+            continue
+        url: str = ''
+        if post.url:
+            url = str(base_url.join(yarl.URL(post.url)))
+        else:
+            loader.logger.warning('no link found in post %r', post.full_id)
+        title: str = ' '.join(post.title) or post.full_id
+        text: str = '\n'.join(post.text)
+        if not (text or post.images):
+            loader.logger.error('empty post: %r', post.full_id)
+        res.append(Post(
+            link, post.id, url,
+            html.escape(title), html.escape(text), post.images
+        ))
+    return res
@@ -0,0 +1,61 @@
+import sys
+import time
+import queue
+import logging
+import logging.handlers
+from typing import Dict, Tuple
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate: int, interval: float = 60):
+        super().__init__()
+        self.rate: int = rate
+        self.interval: float = interval
+        self.counters: Dict[Tuple[str, str], Tuple[float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key: Tuple[str, str] = (record.name, str(record.msg))
+        now: float = time.monotonic()
+        start, count = self.counters.get(key, (now, 0))
+        if now - start >= self.interval:
+            if count > self.rate:
+                record.msg = (
+                    f'[{count - self.rate} similar messages suppressed]'
+                    f' {record.msg}'
+                )
+            start, count = now, 0
+        count += 1
+        self.counters[key] = (start, count)
+        return count <= self.rate
+
+SCALARS: Tuple[type, ...] = (str, bytes, int, float, type(None))
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # the queue never leaves the process: records with only immutable
+    # arguments are formatted by the listener thread, others are formatted
+    # here before the logged objects can change
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if (record.exc_info is None and
+                isinstance(record.args, tuple) and
+                all(isinstance(arg, SCALARS) for arg in record.args)):
+            return record
+        return super().prepare(record)
+
+def start_logging(level: str,
+                  format_: str,
+                  rate: int = 0) -> logging.handlers.QueueListener:
+    handler: logging.Handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(format_))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler: logging.Handler = LazyQueueHandler(records)
+    if rate > 0:
+        queue_handler.addFilter(RateLimitFilter(rate))
+    root: logging.Logger = logging.getLogger()
+    for handler_ in root.handlers[:]:
+        root.removeHandler(handler_)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -0,0 +1,97 @@
+import time
+import asyncio
+import logging
+from typing import Optional, List, Dict, Set, Tuple, Any
+
+import aiogram
+from aiogram.utils import exceptions
+
+from .config import BotConfig
+from .util import JsonObject
+
+class BotPool:
+    CHAT_REMOVED_ERRORS = (
+        exceptions.BotKicked,
+        exceptions.BotBlocked,
+        exceptions.ChatNotFound,
+        exceptions.CantInitiateConversation
+    )
+
+    def __init__(self,
+                 config: BotConfig,
+                 primary: aiogram.Bot,
+                 bots: Optional[List[aiogram.Bot]] = None):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.config: BotConfig = config
+        self.bots: List[aiogram.Bot] = [primary] + (bots or [])
+        self.limited_until: Dict[int, float] = {}
+        self.disabled: Set[int] = set()
+        self.removed: Set[Tuple[int, int]] = set()
+
+    @property
+    def primary(self) -> aiogram.Bot:
+        return self.bots[0]
+
+    def get_chat_bot(self, chat_id: int) -> int:
+        chat: Optional[JsonObject] = self.config.get_chat_config(chat_id)
+        index: Optional[int] = None
+        if chat is not None:
+            index = chat.get('bot')
+        if index is None or not 0 <= index < len(self.bots):
+            index = chat_id % len(self.bots)
+        return index
+
+    def get_candidates(self, chat_id: int) -> List[int]:
+        index: int = self.get_chat_bot(chat_id)
+        indices: List[int] = [index] if index == 0 else [index, 0]
+        return [
+            i for i in indices
+            if i not in self.disabled and (i, chat_id) not in self.removed
+        ]
+
+    async def send(self, chat_id: int, method: str, *args, **kwargs) -> Any:
+        error: Optional[Exception] = None
+        while True:
+            candidates: List[int] = self.get_candidates(chat_id)
+            if not candidates:
+                raise error or RuntimeError(f'no bots available for {chat_id}')
+            now: float = time.monotonic()
+            ready: List[int] = [
+                i for i in candidates if self.limited_until.get(i, 0) <= now
+            ]
+            if not ready:
+                delay: float = min(self.limited_until[i] for i in candidates)
+                delay -= now
+                self.logger.info(
+                    'all bots for chat %r are rate limited, waiting %.1fs',
+                    chat_id, delay
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            index: int = ready[0]
+            try:
+                return await getattr(self.bots[index], method)(
+                    chat_id, *args, **kwargs
+                )
+            except exceptions.RetryAfter as ex:
+                self.logger.warning(
+                    'bot %r is rate limited for %ss', index, ex.timeout
+                )
+                self.limited_until[index] = time.monotonic() + ex.timeout
+                error = ex
+            except self.CHAT_REMOVED_ERRORS as ex:
+                self.logger.error(
+                    'bot %r can not send to chat %r: %r', index, chat_id, ex
+                )
+                self.removed.add((index, chat_id))
+                error = ex
+            except exceptions.Unauthorized as ex:
+                self.logger.error('bot %r is unauthorized: %r', index, ex)
+                if index == 0:
+                    raise
+                self.disabled.add(index)
+                error = ex
+
+    async def close(self) -> None:
+        await asyncio.gather(*(bot.close() for bot in self.bots))
@@ -1,10 +1,20 @@
-from typing import Optional, List
+import re
+import html
+import hashlib
+from typing import Optional, List, Type
 
 import yarl
 
 from .link import Link
+from .seen import DIGEST_SIZE
+from .util import JsonObject
+
+TAG_RE = re.compile(r'<[^>]+>')
+NON_WORD_RE = re.compile(r'\W+')
 
 class Post:
+    __slots__ = ('id', 'url', 'title', 'text', 'image_urls', 'link')
+
     def __init__(self,
                  link: Link,
                  id_: int,
@@ -19,7 +29,45 @@ class Post:
         self.image_urls: List[str] = image_urls or []
         self.link: Link = link
 
-    def to_html(self) -> str:
-        return (
-            f'<a href="{str(yarl.URL(self.url))}">{self.title}</a>\n{self.text}'
-        )
+    def __repr__(self) -> str:
+        return f'<Post {self.link.type}:{self.link.id}#{self.id}>'
+
+    def fingerprint(self) -> int:
+        text: str = NON_WORD_RE.sub(
+            ' ', html.unescape(TAG_RE.sub(' ', self.text)).lower()
+        ).strip()
+        images: List[str] = sorted({
+            yarl.URL(url).with_query(None).with_fragment(None).path
+            for url in self.image_urls
+        })
+        if not text and not images:
+            return 0
+        digest: bytes = hashlib.blake2b(
+            '\n'.join([text, *images]).encode('utf-8'),
+            digest_size=DIGEST_SIZE
+        ).digest()
+        return int.from_bytes(digest, 'big')
+
+    def to_json(self) -> JsonObject:
+        return {
+            'link': self.link.to_json(),
+            'id': self.id,
+            'url': self.url,
+            'title': self.title,
+            'text': self.text,
+            'image_urls': self.image_urls
+        }
+
+    @classmethod
+    def from_json(cls: Type, json: JsonObject):
+        try:
+            return cls(
+                Link.from_json(json['link']),
+                json['id'],
+                json['url'],
+                json['title'],
+                json.get('text', ''),
+                json.get('image_urls')
+            )
+        except KeyError:
+            raise ValueError(f'invalid post json: {repr(json)}')
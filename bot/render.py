@@ -0,0 +1,148 @@
+import re
+import html
+from typing import List, Tuple, Optional, Iterator
+
+import yarl
+
+from .post import Post
+
+MAX_MESSAGE_LENGTH: int = 4096
+MAX_CAPTION_LENGTH: int = 1024
+ALLOWED_TAGS = frozenset((
+    'a', 'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del',
+    'code', 'pre', 'span', 'tg-spoiler', 'blockquote'
+))
+ALLOWED_ENTITIES = frozenset(('lt', 'gt', 'amp', 'quot'))
+TOKEN_RE = re.compile(
+    r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)(?:\s[^<>]*)?>'
+    r'|&(#[0-9]+|#x[0-9a-fA-F]+|[a-zA-Z]+);'
+    r'|[<>&]'
+)
+
+Token = Tuple[str, str, str]
+RenderedPost = Tuple[Optional[str], List[str]]
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+def tokenize(text: str) -> Iterator[Token]:
+    pos: int = 0
+    for match in TOKEN_RE.finditer(text):
+        if match.start() > pos:
+            yield 'text', text[pos:match.start()], ''
+        token: str = match.group(0)
+        if match.group(2) is not None:
+            kind: str = 'close' if match.group(1) else 'open'
+            yield kind, token, match.group(2).lower()
+        elif match.group(3) is not None:
+            yield 'entity', token, match.group(3).lower()
+        else:
+            yield 'invalid', token, ''
+        pos = match.end()
+    if pos < len(text):
+        yield 'text', text[pos:], ''
+
+def check_html(text: str) -> bool:
+    stack: List[str] = []
+    for kind, _, name in tokenize(text):
+        if kind == 'invalid':
+            return False
+        if kind == 'entity':
+            if not name.startswith('#') and name not in ALLOWED_ENTITIES:
+                return False
+        elif kind == 'open':
+            if name not in ALLOWED_TAGS:
+                return False
+            stack.append(name)
+        elif kind == 'close':
+            if not stack or stack.pop() != name:
+                return False
+    return not stack
+
+def cut_text(text: str, length: int) -> int:
+    cut: int = length
+    while cut > 0 and utf16_len(text[:cut]) > length:
+        cut -= max(1, (utf16_len(text[:cut]) - length) // 2)
+    if cut >= len(text):
+        return len(text)
+    for sep in ('\n', ' '):
+        pos: int = text.rfind(sep, 0, cut)
+        if pos >= cut // 2:
+            return pos + 1
+    return cut
+
+def split_html(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    if utf16_len(text) <= max_length:
+        return [text]
+    chunks: List[str] = []
+    chunk: List[str] = []
+    length: int = 0
+    content: bool = False
+    stack: List[Tuple[str, str]] = []
+    reserved: int = 0
+
+    def flush() -> None:
+        nonlocal chunk, length, content
+        chunks.append(''.join(chunk) + ''.join(
+            f'</{name}>' for name, _ in reversed(stack)
+        ))
+        chunk = [tag for _, tag in stack]
+        length = sum(utf16_len(tag) for tag in chunk)
+        content = False
+
+    for kind, token, name in tokenize(text):
+        size: int = utf16_len(token)
+        if kind == 'close':
+            chunk.append(token)
+            length += size
+            if stack:
+                reserved -= utf16_len(f'</{stack.pop()[0]}>')
+            continue
+        if kind == 'open':
+            size += utf16_len(f'</{name}>')
+        if kind != 'text' or length + reserved + size <= max_length:
+            if content and length + reserved + size > max_length:
+                flush()
+            chunk.append(token)
+            length += utf16_len(token)
+            if kind == 'open':
+                stack.append((name, token))
+                reserved += utf16_len(f'</{name}>')
+            else:
+                content = True
+            continue
+        while token:
+            room: int = max_length - length - reserved
+            if utf16_len(token) <= room:
+                chunk.append(token)
+                length += utf16_len(token)
+                content = True
+                break
+            cut: int = cut_text(token, room) if room > 0 else 0
+            if cut <= 0 and content:
+                flush()
+                continue
+            cut = max(cut, 1)
+            chunk.append(token[:cut])
+            content = True
+            flush()
+            token = token[cut:]
+    if content:
+        flush()
+    return chunks
+
+def safe_html(text: str) -> str:
+    return text if check_html(text) else html.escape(text)
+
+def render_link(post: Post) -> str:
+    return f'<a href="{str(yarl.URL(post.url))}">{safe_html(post.title)}</a>'
+
+def render_post(post: Post,
+                max_length: int = MAX_MESSAGE_LENGTH,
+                max_caption_length: int = MAX_CAPTION_LENGTH) -> RenderedPost:
+    text: str = f'{render_link(post)}\n{safe_html(post.text)}'
+    caption: Optional[str] = None
+    if post.image_urls and utf16_len(text) <= max_caption_length:
+        caption = text
+    return caption, split_html(text, max_length)
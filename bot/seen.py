@@ -0,0 +1,104 @@
+import base64
+from collections import deque
+from typing import Iterable, Iterator, Deque, FrozenSet, List
+
+DIGEST_SIZE: int = 8
+
+def encode_ids(ids: Iterable[int]) -> str:
+    data: bytearray = bytearray()
+    prev: int = 0
+    for id_ in ids:
+        delta: int = id_ - prev
+        prev = id_
+        value: int = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while value >= 0x80:
+            data.append((value & 0x7f) | 0x80)
+            value >>= 7
+        data.append(value)
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+def decode_ids(data: str) -> List[int]:
+    ids: List[int] = []
+    prev: int = 0
+    value: int = 0
+    shift: int = 0
+    for byte in base64.b64decode(data):
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += value // 2 if not value & 1 else -(value + 1) // 2
+        ids.append(prev)
+        value = shift = 0
+    return ids
+
+# post fingerprints are random: store them as fixed width digests
+def encode_digests(digests: Iterable[int]) -> str:
+    return base64.b64encode(b''.join(
+        digest.to_bytes(DIGEST_SIZE, 'big') for digest in digests
+    )).decode('ascii')
+
+def decode_digests(data: str) -> List[int]:
+    raw: bytes = base64.b64decode(data)
+    return [
+        int.from_bytes(raw[i:i + DIGEST_SIZE], 'big')
+        for i in range(0, len(raw) - DIGEST_SIZE + 1, DIGEST_SIZE)
+    ]
+
+
+class SeenPosts:
+    def __init__(self, size: int, ids: Iterable[int] = ()):
+        self.ids: Deque[int] = deque(ids, maxlen=size)
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self.ids
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def decode(cls, size: int, data: str) -> 'SeenPosts':
+        return cls(size, decode_ids(data) if data else ())
+
+    def encode(self) -> str:
+        return encode_ids(self.ids)
+
+    def add(self, post_id: int) -> None:
+        if post_id not in self.ids:
+            self.ids.append(post_id)
+
+    def floor(self, last_post_id: int) -> int:
+        return min(min(self.ids, default=last_post_id), last_post_id)
+
+
+class SeenDigests(SeenPosts):
+    @classmethod
+    def decode(cls, size: int, data: str) -> 'SeenDigests':
+        return cls(size, decode_digests(data) if data else ())
+
+    def encode(self) -> str:
+        return encode_digests(self.ids)
+
+
+# last post id of a link that also knows which older posts were delivered
+class PostCursor(int):
+    def __new__(cls,
+                last_post_id: int,
+                floor: int,
+                seen: FrozenSet[int] = frozenset()):
+        self = super().__new__(cls, last_post_id)
+        self.floor = floor
+        self.seen = seen
+        return self
+
+    def is_new(self, post_id: int) -> bool:
+        return post_id > self.floor and post_id not in self.seen
+
+
+def is_new(post_id: int, last_post_id: int) -> bool:
+    if isinstance(last_post_id, PostCursor):
+        return last_post_id.is_new(post_id)
+    return post_id > last_post_id
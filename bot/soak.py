@@ -0,0 +1,269 @@
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import logging
+import resource
+import tempfile
+import tracemalloc
+from email.utils import formatdate
+from argparse import ArgumentParser, Namespace
+from typing import List, Tuple, Optional
+
+import aiogram
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+
+from .bot import Bot
+from .config import BotConfig
+from .log import start_logging
+from .util import Arguments, JsonObject
+
+TOKEN: str = '1:soak'
+SITES: Tuple[str, ...] = ('*/bot/loader/*', '*/bot/config.py')
+
+def create_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog='python -m bot.soak',
+        description=('run update cycles against local stub feeds'
+                     ' and a stub bot api, and check memory growth')
+    )
+    parser.add_argument(
+        '-c', '--cycles', metavar='N', type=int, default=1000,
+        help='number of update cycles (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-w', '--warmup', metavar='N', type=int, default=None,
+        help=('number of update cycles before measuring'
+              ' (default: until the seen post windows are full)')
+    )
+    parser.add_argument(
+        '-n', '--links', metavar='N', type=int, default=20,
+        help='number of links (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-p', '--posts', metavar='N', type=int, default=2,
+        help='new posts per link per cycle (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-s', '--sample', metavar='N', type=int, default=50,
+        help='sample memory every N cycles (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-m', '--max-growth', metavar='BYTES', type=float, default=2048,
+        help=('max traced memory growth per cycle'
+              ' (default: %(default)s)')
+    )
+    parser.add_argument(
+        '-r', '--max-rss-growth', metavar='BYTES', type=float, default=16384,
+        help='max rss growth per cycle (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-t', '--top', metavar='N', type=int, default=10,
+        help='number of top allocating sites to show (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-l', '--log-level',
+        default='warning',
+        choices=('critical', 'error', 'warning', 'info', 'debug'),
+        help='log level (default: %(default)s)'
+    )
+    return parser
+
+def get_rss() -> int:
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def get_warmup(posts: int) -> int:
+    # seen posts and fingerprints grow until their windows are full
+    window: int = max(
+        BotConfig.DEFAULTS['seen_posts'],
+        BotConfig.DEFAULTS['duplicate_window']
+    )
+    return -(-window // max(posts, 1)) + 1
+
+def collect() -> None:
+    # the type attribute cache keeps up to a few thousand attribute names
+    # alive, bounded but slowly filling with names built at runtime
+    sys._clear_type_cache() # pylint:disable=protected-access
+    gc.collect()
+
+def get_slope(samples: List[Tuple[int, int]]) -> float:
+    if len(samples) < 2:
+        return 0
+    n: int = len(samples)
+    mean_x: float = sum(x for x, _ in samples) / n
+    mean_y: float = sum(y for _, y in samples) / n
+    var: float = sum((x - mean_x) ** 2 for x, _ in samples)
+    cov: float = sum((x - mean_x) * (y - mean_y) for x, y in samples)
+    return cov / var
+
+class StubServer:
+    def __init__(self, posts: int):
+        self.posts: int = posts
+        self.cycle: int = 0
+        self.first: int = int(time.time()) - 86400
+        self.messages: int = 0
+        self.app: web.Application = web.Application()
+        self.app.router.add_get('/feed/{id}', self.feed)
+        self.app.router.add_post('/bot{token}/{method}', self.api)
+        self.runner: web.AppRunner = web.AppRunner(self.app)
+        self.url: str = ''
+
+    async def start(self) -> None:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port: int = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    async def feed(self, request: web.Request) -> web.Response:
+        feed_id: str = request.match_info['id']
+        last: int = self.first + self.cycle * self.posts
+        items: List[str] = []
+        for timestamp in range(last, max(last - 20, self.first), -1):
+            items.append(
+                f'<item><title>post {feed_id}/{timestamp}</title>'
+                f'<link>https://example.com/{feed_id}/{timestamp}</link>'
+                f'<pubDate>{formatdate(timestamp)}</pubDate>'
+                f'<description>{"text " * 50}</description>'
+                f'<enclosure type="image/jpeg"'
+                f' url="https://example.com/{timestamp}.jpg"/></item>'
+            )
+        return web.Response(
+            text=f'<rss><channel>{"".join(items)}</channel></rss>',
+            content_type='application/rss+xml'
+        )
+
+    async def api(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        self.messages += 1
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.messages,
+            'date': int(time.time()),
+            'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'}
+        }})
+
+class SoakBot(Bot):
+    def __init__(self, config_path: str, server: str, **kwargs):
+        self.server: TelegramAPIServer = TelegramAPIServer.from_base(server)
+        super().__init__(config_path, **kwargs)
+
+    def create_bot(self, token: str) -> aiogram.Bot:
+        return aiogram.Bot(
+            token=token,
+            loop=self.loop,
+            server=self.server,
+            connections_limit=self.config['connections_limit']
+        )
+
+def create_config(path: str, url: str, links: int) -> None:
+    config: JsonObject = {
+        'token': TOKEN,
+        'bot_user': {'id': int(TOKEN.split(':')[0]), 'username': 'soak'},
+        'link_update_interval': 0,
+        'link_prime_posts': 0,
+        'save_interval': 0,
+        'connections_limit': 10,
+        'loader': {
+            'min_delay': 0,
+            'max_delay': 0,
+            'max_connections': 10,
+            'max_connections_per_host': 10
+        },
+        'chats': [
+            {'id': 1000 + i, 'links': [
+                {'type': 'feed', 'id': f'{url}/feed/{i}'}
+            ]}
+            for i in range(links)
+        ]
+    }
+    with open(path, 'w') as fp:
+        json.dump(config, fp)
+
+async def soak(args: Namespace, path: str) -> bool:
+    logger: logging.Logger = logging.getLogger(__name__)
+    server: StubServer = StubServer(args.posts)
+    await server.start()
+    create_config(path, server.url, args.links)
+    bot: SoakBot = SoakBot(path, server.url, loop=asyncio.get_event_loop())
+    samples: List[Tuple[int, int]] = []
+    rss_samples: List[Tuple[int, int]] = []
+    size_samples: List[Tuple[int, int]] = []
+    snapshot: Optional[tracemalloc.Snapshot] = None
+    try:
+        for cycle in range(args.warmup + args.cycles):
+            server.cycle = cycle + 1
+            await bot.process_link_updates()
+            bot.save()
+            measured: int = cycle - args.warmup
+            if measured == 0:
+                collect()
+                tracemalloc.start()
+                snapshot = tracemalloc.take_snapshot()
+            if measured >= 0 and measured % args.sample == 0:
+                collect()
+                samples.append((measured, tracemalloc.get_traced_memory()[0]))
+                rss_samples.append((measured, get_rss()))
+                size_samples.append((measured, os.path.getsize(path)))
+                logger.info(
+                    'cycle %d: traced=%d rss=%d state=%d', measured,
+                    samples[-1][1], rss_samples[-1][1], size_samples[-1][1]
+                )
+        collect()
+        stats: List[tracemalloc.StatisticDiff] = []
+        if snapshot is not None:
+            filters = [tracemalloc.Filter(True, site) for site in SITES]
+            stats = tracemalloc.take_snapshot().filter_traces(filters) \
+                .compare_to(snapshot.filter_traces(filters), 'lineno')
+            tracemalloc.stop()
+    finally:
+        await bot.stop()
+        await server.stop()
+
+    growth: float = get_slope(samples)
+    rss_growth: float = get_slope(rss_samples)
+    print(f'cycles: {args.cycles} (+{args.warmup} warmup)')
+    print(f'posts sent: {bot.stats["posts"]}, errors:'
+          f' {bot.stats["link_errors"] + bot.stats["chat_errors"]}')
+    print(f'traced memory growth: {growth:.1f} bytes/cycle'
+          f' (max {args.max_growth})')
+    print(f'rss growth: {rss_growth:.1f} bytes/cycle'
+          f' (max {args.max_rss_growth})')
+    print(f'state size growth: {get_slope(size_samples):.1f} bytes/cycle')
+    print(f'top {args.top} allocating sites:')
+    for stat in stats[:args.top]:
+        print(f'  {stat}')
+    return growth <= args.max_growth and rss_growth <= args.max_rss_growth
+
+def main(argv: Arguments = None) -> int:
+    parser: ArgumentParser = create_arg_parser()
+    args: Namespace = parser.parse_args(argv)
+    if args.warmup is None:
+        args.warmup = get_warmup(args.posts)
+    listener = start_logging(args.log_level.upper(), Bot.LOG_FORMAT)
+    loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    fd, path = tempfile.mkstemp(prefix='bot-soak-', suffix='.json')
+    os.close(fd)
+    try:
+        ok: bool = loop.run_until_complete(soak(args, path))
+    finally:
+        loop.close()
+        listener.stop()
+        os.remove(path)
+    if not ok:
+        print('FAILED: memory growth exceeds the limit')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
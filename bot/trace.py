@@ -0,0 +1,64 @@
+import json
+import time
+import logging
+from contextlib import contextmanager
+from typing import Optional, List, Iterator, Any
+
+from .link import Link
+from .util import JsonObject
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.path: Optional[str] = path or None
+        self.cycle: int = 0
+        self.spans: List[JsonObject] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @staticmethod
+    def format_link(link: Link) -> str:
+        return f'{link.type}:{link.id}'
+
+    def start_cycle(self) -> None:
+        self.cycle += 1
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        span: JsonObject = {
+            'cycle': self.cycle,
+            'name': name,
+            'start': time.time()
+        }
+        span.update(attrs)
+        start: float = time.perf_counter()
+        try:
+            yield
+        except BaseException as ex:
+            span['error'] = repr(ex)
+            raise
+        finally:
+            span['duration'] = time.perf_counter() - start
+            self.spans.append(span)
+
+    def flush(self) -> None:
+        if not (self.enabled and self.spans):
+            return
+        spans: List[JsonObject] = self.spans
+        self.spans = []
+        self.logger.debug('writing %d spans to %r', len(spans), self.path)
+        try:
+            with open(self.path, 'a') as fp:
+                for span in spans:
+                    fp.write(json.dumps(span))
+                    fp.write('\n')
+        except OSError as ex:
+            self.logger.error(
+                'error writing trace to %r: %r',
+                self.path, ex, exc_info=ex
+            )
@@ -1,4 +1,11 @@
-from typing import Dict, Optional, Any, TypeVar, Union, Iterable
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import (
+    Dict, Optional, Any, TypeVar, Union, Iterable, Iterator, AsyncIterator,
+    List, Tuple
+)
 
 T = TypeVar('T')
 JsonObject = Dict[str, Any]
@@ -8,3 +15,38 @@ Cookies = Dict[str, Dict[str, str]]
 
 class CommandError(Exception):
     pass
+
+class PrioritySemaphore:
+    def __init__(self, value: int = 1):
+        self.value: int = value
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.counter: Iterator[int] = itertools.count()
+
+    async def acquire(self, priority: int = 0) -> None:
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        future: asyncio.Future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -44,6 +44,9 @@ setup(name='telegram-scraper-bot',
           'ig': [
               'instaloader',
               'requests[socks]'
+          ],
+          'fast': [
+              'orjson'
           ]
       },
       python_requires='>=3.7',
@@ -0,0 +1,73 @@
+import json
+import asyncio
+
+import pytest
+
+from bot.bot import Bot
+from bot.link import Link
+from bot.post import Post
+
+LINK = Link('vk', 'club1')
+
+
+@pytest.fixture
+def bot(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'token': '1:test',
+        'bot_user': {'id': 1, 'username': 'test'},
+        'chats': [{'id': 1, 'links': [LINK.to_json()]}]
+    }))
+    loop = asyncio.new_event_loop()
+    bot = Bot(str(path), loop=loop)
+    yield bot
+    loop.run_until_complete(bot.stop())
+    loop.close()
+
+
+def get_post(post_id):
+    return Post(LINK, post_id, f'https://vk.com/wall-1_{post_id}', 'title')
+
+
+def test_prime_link_pinned_post(bot, monkeypatch):
+    sent = []
+
+    async def load(link, last_post_id=0, priority=0):
+        # a pinned post is at the top of the page and is parsed last
+        return [get_post(post_id) for post_id in (28, 29, 30, 5)]
+
+    async def create_posts(chat_id, posts, digest=False):
+        sent.extend(post.id for post in posts)
+
+    monkeypatch.setattr(bot.loader, 'load', load)
+    monkeypatch.setattr(bot, 'create_posts', create_posts)
+    bot.config['link_prime_posts'] = 2
+    link_json = bot.config.get_link_config(1, LINK)
+    bot.loop.run_until_complete(bot._prime_link(1, LINK, link_json))
+    assert sent == [29, 30]
+    assert link_json['last_post_id'] == 30
+
+
+def test_bulk_add_does_not_deliver(bot, monkeypatch):
+    sent = []
+
+    async def load(link, last_post_id=0, priority=0):
+        return [get_post(post_id) for post_id in (1, 2, 3)]
+
+    async def create_posts(chat_id, posts, digest=False):
+        sent.extend(post.id for post in posts)
+
+    async def prime():
+        bot.commands._add_links(1, ['https://vk.com/club2'])
+        bot.commands._add_links(
+            1, ['https://vk.com/club3', 'https://vk.com/club4']
+        )
+        await asyncio.gather(*bot._prime_tasks)
+
+    monkeypatch.setattr(bot.loader, 'load', load)
+    monkeypatch.setattr(bot, 'create_posts', create_posts)
+    bot.loop.run_until_complete(prime())
+    assert sent == [3]
+    for link_id in ('club2', 'club3', 'club4'):
+        link_json = bot.config.get_link_config(1, Link('vk', link_id))
+        assert link_json['last_post_id'] == 3
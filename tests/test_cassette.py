@@ -0,0 +1,39 @@
+import asyncio
+
+from bot.link import Link
+from bot.loader.cassette import Cassette
+
+LINK = Link('feed', 'https://example.com/feed')
+
+
+def replay(cassette, last_post_id):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(cassette.replay(LINK, last_post_id))
+    finally:
+        loop.close()
+
+
+def test_record_overwrites_repeats(tmp_path):
+    path = str(tmp_path / 'cassette.json.gz')
+    cassette = Cassette(path, 'record')
+    cassette.record(LINK, 0, 'first')
+    cassette.record(LINK, 10, 'second')
+    cassette.record(LINK, 0, 'third')
+    assert list(cassette.entries['feed:' + LINK.id]) == ['10', '0']
+    cassette.save()
+
+    cassette = Cassette(path, 'replay')
+    assert replay(cassette, 0) == 'third'
+    assert replay(cassette, 10) == 'second'
+    assert replay(cassette, 0) == 'third'
+    assert replay(cassette, 5) == 'third'
+
+
+def test_record_limit(tmp_path):
+    cassette = Cassette(str(tmp_path / 'cassette.json.gz'), 'record')
+    for last_post_id in range(Cassette.MAX_ENTRIES + 5):
+        cassette.record(LINK, last_post_id, last_post_id)
+    entries = cassette.entries['feed:' + LINK.id]
+    assert len(entries) == Cassette.MAX_ENTRIES
+    assert next(iter(entries)) == '5'
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from collections import Counter
+
+import pytest
+
+from bot import cli
+
+
+class FakeBot:
+    LOG_FORMAT = cli.Bot.LOG_FORMAT
+    stats = Counter()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def run(self):
+        return self.stats
+
+    async def stop(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+@pytest.mark.parametrize('stats,status', [
+    ({}, 0),
+    ({'links': 2, 'posts': 3}, 0),
+    ({'links': 2, 'link_errors': 1}, 2),
+    ({'links': 2, 'link_timeouts': 1}, 2),
+    ({'links': 2, 'chat_errors': 1}, 2),
+])
+def test_single_run_status(monkeypatch, stats, status):
+    monkeypatch.setattr(FakeBot, 'stats', Counter(stats))
+    monkeypatch.setattr(cli, 'Bot', FakeBot)
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    assert cli.main(['-l', 'critical', 'config.json']) == status
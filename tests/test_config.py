@@ -0,0 +1,86 @@
+import json
+import asyncio
+
+import pytest
+
+from bot.link import Link
+from bot.post import Post
+from bot.config import BotConfig
+
+FEED = Link('feed', 'https://example.com/feed')
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'token': '1:test',
+        'chats': [
+            {'id': 1, 'links': [FEED.to_json()]},
+            {'id': 2, 'links': [FEED.to_json()]}
+        ]
+    }))
+    return BotConfig(str(path))
+
+
+def test_link_validators(config):
+    validators = {'max_post_id': '10', 'etag': '"1"'}
+    config.set_link_validators(FEED, validators)
+    assert config.dirty
+    assert config.get_link_validators() == {FEED: validators}
+    config.save()
+    assert BotConfig(config.path).get_link_validators() == {FEED: validators}
+    config.set_link_validators(FEED, dict(validators))
+    assert not config.dirty
+
+
+def test_dirty(config):
+    post = Post(FEED, 10, 'https://example.com/10', 'title', 'text')
+    assert not config.dirty
+
+    config.set_pending({1: [post]})
+    assert config.dirty
+    config.dirty = False
+    pending = config.pop_pending()
+    assert [post_.id for post_ in pending[1]] == [post.id]
+    assert config.dirty
+    config.dirty = False
+    assert config.pop_pending() == {}
+    assert not config.dirty
+
+    config.update_last_post_id(1, post)
+    assert config.dirty
+    assert config.is_post_sent(1, post)
+    config.dirty = False
+    config.set_pending({1: [post]})
+    assert not config.dirty
+
+    assert config.add_links(1, [FEED]) == []
+    assert not config.dirty
+    link = Link('feed', 'https://example.com/other')
+    assert config.add_links(1, [FEED, link]) == [link]
+    assert config.dirty
+
+
+def test_save(config):
+    config.add_links(1, [Link('feed', 'https://example.com/other')])
+    config.save()
+    assert not config.dirty
+    with open(config.path) as fp:
+        assert json.load(fp) == config.json
+    with open(config.path) as fp:
+        assert fp.read() == str(config)
+
+
+def test_checkpoint(config):
+    loop = asyncio.new_event_loop()
+    try:
+        config.loop = loop
+        config.add_links(1, [Link('feed', 'https://example.com/other')])
+        loop.run_until_complete(config.checkpoint())
+        loop.run_until_complete(config.stop_checkpoints())
+    finally:
+        loop.close()
+    assert not config.dirty
+    with open(config.path) as fp:
+        assert json.load(fp) == config.json
@@ -0,0 +1,32 @@
+import logging
+import queue
+
+from bot.log import LazyQueueHandler
+
+
+def emit(*args):
+    records = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    logger = logging.getLogger('test_log')
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    try:
+        logger.warning(*args)
+    finally:
+        logger.removeHandler(handler)
+    return records.get_nowait()
+
+
+def test_scalar_args_are_formatted_lazily():
+    record = emit('%s %d', 'a', 1)
+    assert record.args == ('a', 1)
+    assert record.getMessage() == 'a 1'
+
+
+def test_mutable_args_are_formatted_on_emit():
+    data = {'a': 1}
+    record = emit('%r', data)
+    data['b'] = 2
+    assert record.args is None
+    assert record.getMessage() == "{'a': 1}"
@@ -0,0 +1,79 @@
+import time
+import asyncio
+
+import yarl
+import pytest
+
+from bot.link import Link
+from bot.loader import Loader
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_wait_paces_requests(loop):
+    loader = Loader(loop=loop, min_delay=0.05, max_delay=0.05)
+    proxy = loader.proxies[0]
+
+    async def wait():
+        start = time.monotonic()
+        await asyncio.gather(*(proxy.wait() for _ in range(3)))
+        return time.monotonic() - start
+
+    try:
+        assert loop.run_until_complete(wait()) >= 0.1
+    finally:
+        loop.run_until_complete(loader.close())
+
+
+def test_cookies_per_proxy(loop):
+    loader = Loader(
+        loop=loop, proxies=[None, None],
+        cookies={'https://vk.com': {'remixlang': '0'}}
+    )
+    url = yarl.URL('https://vk.com/club1')
+    try:
+        first, second = (proxy.session.cookie_jar for proxy in loader.proxies)
+        assert first is not second
+        assert first.filter_cookies(url)['remixlang'].value == '0'
+        first.update_cookies({'remixsid': '1'}, url)
+        assert 'remixsid' not in second.filter_cookies(url)
+        assert second.filter_cookies(url)['remixlang'].value == '0'
+    finally:
+        loop.run_until_complete(loader.close())
+
+
+def test_load_priority_order(loop, monkeypatch):
+    loader = Loader(
+        loop=loop, min_delay=0.01, max_delay=0.01, max_connections=1
+    )
+    loaded = []
+
+    async def load(link, last_post_id, proxy):
+        loaded.append(link.id)
+        await asyncio.sleep(0)
+        return ''
+
+    async def parse(link, content, last_post_id):
+        return
+        yield
+
+    monkeypatch.setattr(loader, 'load_default', load)
+    monkeypatch.setattr(loader, 'parse', parse)
+    links = [(Link('hb', str(i)), 0) for i in range(6)]
+    links.append((Link('hb', 'x'), 10))
+
+    async def load_all():
+        await asyncio.gather(*(
+            loader.load(link, 0, priority) for link, priority in links
+        ))
+
+    try:
+        loop.run_until_complete(load_all())
+    finally:
+        loop.run_until_complete(loader.close())
+    assert loaded.index('x') == 1
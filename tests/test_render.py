@@ -0,0 +1,93 @@
+from bot.link import Link
+from bot.post import Post
+from bot.digest import render_digest
+from bot.render import (
+    utf16_len, check_html, split_html, render_post, MAX_CAPTION_LENGTH
+)
+
+LINK = Link('feed', 'https://example.com/feed')
+
+
+def get_post(text, title='title', images=None):
+    return Post(LINK, 1, 'https://example.com/1', title, text, images)
+
+
+def test_utf16_len():
+    assert utf16_len('abc') == 3
+    assert utf16_len('я') == 1
+    assert utf16_len('😀') == 2
+
+
+def test_check_html():
+    assert check_html('<b>a</b> &amp; <a href="x">b</a>')
+    assert check_html('&#128512; &#x1F600;')
+    assert not check_html('<b>a')
+    assert not check_html('<b>a</i></b>')
+    assert not check_html('<div>a</div>')
+    assert not check_html('a < b')
+    assert not check_html('&nbsp;')
+
+
+def test_split_short():
+    assert split_html('<b>a</b>', 10) == ['<b>a</b>']
+
+
+def test_split_reopens_tags():
+    chunks = split_html('<b>' + 'word ' * 10 + '</b>', 20)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert check_html(chunk)
+        assert utf16_len(chunk) <= 20
+        assert chunk.startswith('<b>') and chunk.endswith('</b>')
+    text = ''.join(chunk[3:-4] for chunk in chunks)
+    assert text.split() == ['word'] * 10
+
+
+def test_split_keeps_entities():
+    text = '&amp;' * 10
+    chunks = split_html(text, 12)
+    for chunk in chunks:
+        assert check_html(chunk)
+        assert utf16_len(chunk) <= 12
+    assert ''.join(chunks) == text
+
+
+def test_split_utf16():
+    text = '😀' * 10
+    chunks = split_html(text, 5)
+    assert all(utf16_len(chunk) <= 5 for chunk in chunks)
+    assert ''.join(chunks) == text
+
+
+def test_render_post_caption():
+    caption, texts = render_post(get_post('text', images=['https://x/1.jpg']))
+    assert caption == '<a href="https://example.com/1">title</a>\ntext'
+    assert texts == [caption]
+
+
+def test_render_post_no_caption():
+    caption, texts = render_post(get_post('text'))
+    assert caption is None
+    caption, texts = render_post(
+        get_post('x' * MAX_CAPTION_LENGTH, images=['https://x/1.jpg'])
+    )
+    assert caption is None
+    assert len(texts) == 1
+
+
+def test_render_post_escapes_invalid_html():
+    caption, texts = render_post(get_post('a < b <div>', '<i>t'))
+    assert texts == [
+        '<a href="https://example.com/1">&lt;i&gt;t</a>\n'
+        'a &lt; b &lt;div&gt;'
+    ]
+
+
+def test_render_digest():
+    posts = [get_post('<b>' + '😀' * 50 + '</b>', '<i>t')] * 5
+    messages = render_digest(posts, 40, 150)
+    assert sum(len(batch) for _, batch in messages) == 5
+    for text, _ in messages:
+        assert check_html(text)
+        assert utf16_len(text) <= 150
+        assert '&lt;i&gt;t' in text
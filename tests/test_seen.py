@@ -0,0 +1,32 @@
+import base64
+
+from bot.seen import (
+    DIGEST_SIZE, SeenPosts, SeenDigests, encode_ids, decode_ids,
+    encode_digests, decode_digests
+)
+
+
+def test_ids():
+    ids = [100, 105, 101, 2 ** 40, 3]
+    assert decode_ids(encode_ids(ids)) == ids
+
+
+def test_digests():
+    digests = [0, 1, 2 ** 64 - 1, 0x0123456789abcdef]
+    data = encode_digests(digests)
+    assert len(base64.b64decode(data)) == DIGEST_SIZE * len(digests)
+    assert decode_digests(data) == digests
+    assert decode_digests(encode_digests([])) == []
+
+
+def test_digests_ignore_partial():
+    data = base64.b64encode(bytes(DIGEST_SIZE + 3)).decode('ascii')
+    assert decode_digests(data) == [0]
+
+
+def test_seen_digests():
+    seen = SeenDigests(2, [1, 2])
+    seen.add(2 ** 63)
+    assert list(SeenDigests.decode(2, seen.encode())) == [2, 2 ** 63]
+    assert list(SeenDigests.decode(2, '')) == []
+    assert list(SeenPosts.decode(3, SeenPosts(3, [5, 1]).encode())) == [5, 1]
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from bot.link import Link
+from bot.loader import Loader
+
+
+@pytest.fixture
+def loader():
+    loop = asyncio.new_event_loop()
+    loader = Loader(loop=loop, min_delay=0, max_delay=0)
+    yield loader
+    loop.run_until_complete(loader.close())
+    loop.close()
+
+
+def test_links_differ(loader):
+    links = [Link('synth', f'{name}&posts=2&images=1') for name in 'ab']
+    posts = [
+        loader.loop.run_until_complete(loader.load(link, 1000))
+        for link in links
+    ]
+    assert [post.id for post in posts[0]] == [post.id for post in posts[1]]
+    fingerprints = [{post.fingerprint() for post in posts_} for posts_ in posts]
+    assert len(fingerprints[0]) == 2
+    assert not fingerprints[0] & fingerprints[1]
+    assert not (
+        {post.url for post in posts[0]} & {post.url for post in posts[1]}
+    )
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from bot.link import Link
+from bot.loader import Loader
+from bot.loader import vk
+
+LINK = Link('vk', 'club1')
+
+
+def get_page(post_ids: List[int]) -> str:
+    return ''.join(
+        f'<div class="post" id="post-1_{post_id}"></div>'
+        for post_id in post_ids
+    )
+
+
+@pytest.fixture
+def loader():
+    loop = asyncio.new_event_loop()
+    loader = Loader(loop=loop, min_delay=0, max_delay=0, vk_page_concurrency=1)
+    yield loader
+    loop.run_until_complete(loader.close())
+    loop.close()
+
+
+def load(loader, pages: Dict[int, List[int]], monkeypatch, first=None):
+    offsets: List[int] = []
+
+    async def load_page(session, url, timeout, offset=0, own=False):
+        if not own:
+            return get_page(first or pages[0])
+        offsets.append(offset)
+        return get_page(pages.get(offset, pages[0]))
+
+    monkeypatch.setattr(vk, 'load_page', load_page)
+    res = loader.loop.run_until_complete(vk.load_vk(
+        loader, LINK, 10, loader.proxies[0]
+    ))
+    return [vk.get_post_ids(page) for page in res], offsets
+
+
+def test_load_pages(loader, monkeypatch):
+    pages = {0: [30, 29, 28], 3: [27, 26, 25], 6: [24, 23, 22], 9: [21, 10, 9]}
+    res, offsets = load(loader, pages, monkeypatch)
+    assert offsets == [0, 3, 6, 9]
+    assert res == [pages[0], pages[3], pages[6], pages[9]]
+
+
+def test_load_pages_visitor_posts(loader, monkeypatch):
+    first = [32, 31, 30]
+    pages = {0: [30, 29, 28], 3: [27, 26, 10]}
+    res, offsets = load(loader, pages, monkeypatch, first)
+    assert offsets == [0, 3]
+    assert res == [first, pages[0], pages[3]]
+
+
+def test_load_pages_ignored_offset(loader, monkeypatch):
+    pages = {0: [30, 29, 28]}
+    res, offsets = load(loader, pages, monkeypatch)
+    assert offsets == [0, 3]
+    assert res == [pages[0]]
+
+
+def test_load_pages_repeated_page(loader, monkeypatch):
+    pages = {0: [30, 29, 28], 3: [27, 26, 25], 6: [27, 26, 25]}
+    res, offsets = load(loader, pages, monkeypatch)
+    assert offsets == [0, 3, 6]
+    assert res == [pages[0], pages[3]]
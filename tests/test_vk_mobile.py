@@ -0,0 +1,91 @@
+import os
+import gzip
+import json
+import asyncio
+
+import pytest
+
+from bot.link import Link
+from bot.loader import Loader
+from bot.loader.vk_mobile import MobileWallParser, get_post_ids, parse_page
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+LINK = Link('vk', 'club1')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as fp:
+        return fp.read()
+
+
+@pytest.fixture
+def loader():
+    loop = asyncio.new_event_loop()
+    loader = Loader(loop=loop, min_delay=0, max_delay=0, vk_endpoint='mobile')
+    yield loader
+    loop.run_until_complete(loader.close())
+    loop.close()
+
+
+def test_get_post_ids():
+    content = read_fixture('vk_mobile_wall.html')
+    assert get_post_ids(content) == [103, 102, 101]
+
+
+def test_parse_page(loader):
+    posts = parse_page(loader, LINK, read_fixture('vk_mobile_wall.html'), 0)
+    assert [post.id for post in posts] == [101, 102, 103]
+    post = posts[2]
+    assert post.title == 'Club &amp; Co'
+    assert post.url == 'https://vk.com/wall-1_103'
+    assert post.text == 'First line\nsecond line'
+    assert post.image_urls == ['https://sun.userapi.com/a.jpg']
+    assert posts[1].text == 'Only\ntext\n&lt;here&gt;'
+    assert posts[1].image_urls == []
+    assert posts[0].text == ''
+    assert posts[0].image_urls == ['https://sun.userapi.com/b.jpg']
+
+
+def test_parse_page_skips_old_posts(loader):
+    posts = parse_page(loader, LINK, read_fixture('vk_mobile_wall.html'), 102)
+    assert [post.id for post in posts] == [103]
+
+
+def test_parse_page_implicit_close(loader):
+    content = read_fixture('vk_mobile_implicit_close.html')
+    posts = parse_page(loader, LINK, content, 0)
+    assert [post.id for post in posts] == [200, 201, 202]
+    assert posts[2].text == 'first paragraph\nsecond paragraph'
+    assert posts[1].text == 'unclosed'
+    assert posts[0].text == 'last'
+
+
+def test_parser_closes_item_with_parent():
+    parser = MobileWallParser(0)
+    parser.feed(
+        '<div><div class="wall_item"><a name="post-1_5"></a>'
+        '<div class="pi_text"><p>text</div></div>'
+        '<div><p>outside</div>'
+    )
+    parser.close()
+    assert [(post.id, post.text) for post in parser.posts] == [(5, ['text'])]
+
+
+def test_load_recorded_page(tmp_path):
+    path = str(tmp_path / 'cassette.json.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as fp:
+        json.dump({'version': 2, 'entries': {'vk:club1': {'200': {
+            'time': 0,
+            'content': [read_fixture('vk_mobile_implicit_close.html')]
+        }}}}, fp)
+    loop = asyncio.new_event_loop()
+    loader = Loader(
+        loop=loop, min_delay=0, max_delay=0, vk_endpoint='mobile',
+        cassette=path, cassette_mode='replay'
+    )
+    try:
+        posts = loop.run_until_complete(loader.load(LINK, 200))
+    finally:
+        loop.run_until_complete(loader.close())
+        loop.close()
+    assert [post.id for post in posts] == [201, 202]